@@ -29,6 +29,8 @@ import time
 import jinja2
 import pandas as pd
 from arcpy.sa import *
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Tool_Scripts", "Pre_Post_Processing_Scripts"))
+from QC_Constraints import loadQCConstraints, qcRemapRange
 
 
 def check_extention():
@@ -257,7 +259,7 @@ def compareExtent02(raster0, raster02, tempFolder, shapefilesFolder):
         
     return diff02_0_sts
 
-def compareCellvalue(raster0, raster1, raster2, raster3, tempFolder, shapefilesFolder):
+def compareCellvalue(raster0, raster1, raster2, raster3, tempFolder, shapefilesFolder, qcConstraints):
     """run cell size compare on each raster"""
     try:
         
@@ -271,17 +273,17 @@ def compareCellvalue(raster0, raster1, raster2, raster3, tempFolder, shapefilesF
         #minus3.save(os.path.join(tempFolder, "minus3.tif"))
         msg("Minus raster calculation are complete.")
 
-        reclas1 = arcpy.sa.Reclassify(minus1, "Value", RemapRange([[-1,0.95,1],[0.95,1.05,0],[1.05,10,1]]))
+        reclas1 = arcpy.sa.Reclassify(minus1, "Value", qcRemapRange(qcConstraints, "00FVA", "01FVA"))
         reclas1.save(os.path.join(tempFolder, "reclassify1"))
         #arcpy.management.CopyRaster(reclas1, os.path.join(tempFolder,"reclass1.tif"))
         msg("1/3 reclassify tasks is finished.")
         
-        reclas2 = arcpy.sa.Reclassify(minus2, "Value", RemapRange([[-1,0.95,1],[0.95,1.05,0],[1.05,10,1]]))
+        reclas2 = arcpy.sa.Reclassify(minus2, "Value", qcRemapRange(qcConstraints, "01FVA", "02FVA"))
         reclas2.save(os.path.join(tempFolder, "reclassify2"))
         #arcpy.management.CopyRaster(reclas2, os.path.join(tempFolder,"reclass2.tif"))
         msg("2/3 reclassify tasks is finished.")
         
-        reclas3 = arcpy.sa.Reclassify(minus3, "Value", RemapRange([[-1,0.95,1],[0.95,1.05,0],[1.05,10,1]]))
+        reclas3 = arcpy.sa.Reclassify(minus3, "Value", qcRemapRange(qcConstraints, "02FVA", "03FVA"))
         reclas3.save(os.path.join(tempFolder, "reclassify3"))
         #arcpy.management.CopyRaster(reclas3, os.path.join(tempFolder,"reclass3.tif"))
         msg("3/3 reclassify tasks is finished.")
@@ -291,14 +293,14 @@ def compareCellvalue(raster0, raster1, raster2, raster3, tempFolder, shapefilesF
         msg("Could not compare the cell values.")
     return reclas1, reclas2, reclas3
 
-def compareCellvalue02(raster0, raster02, tempFolder, shapefilesFolder):
+def compareCellvalue02(raster0, raster02, tempFolder, shapefilesFolder, qcConstraints):
     """run cell size compare on each raster"""
     try:
         
         minus1 = RasterCalculator([raster02, raster0], ["x","y"], "y-x", "UnionOf","FirstOf")
         #minus1.save(os.path.join(tempFolder, "minus02"))
 
-        reclas02 = arcpy.sa.Reclassify(minus1, "Value", RemapRange([[-1,0.95,1],[0.95,1.05,0],[1.05,10,1]]))
+        reclas02 = arcpy.sa.Reclassify(minus1, "Value", qcRemapRange(qcConstraints, "0_2PCT", "00FVA"))
         reclas02.save(os.path.join(tempFolder, "reclassify02"))
         msg("4/4 reclassify tasks is finished.")
         
@@ -599,6 +601,9 @@ msg("Raster QC tool has started")
 # Check Spatial Analyst extention
 check_extention()
 
+#Cell QC ranges are shared with the fix tool through Tool_Scripts/FVA_Constraints.json
+qcConstraints = loadQCConstraints(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Tool_Scripts", "FVA_Constraints.json"))
+
 #Define input and output parameters
 arcpy.env.overwriteOutput = True
 #arcpy.env.workspace = tempFolder
@@ -754,10 +759,10 @@ with open(logFile, "w") as log:
             current_time = time.strftime("%m-%d %X",time.localtime())
             log_message("Compare cell value started at " + current_time)
             
-            reclas1, reclas2, reclas3 = compareCellvalue(raster0, raster1, raster2, raster3, tempFolder, shapefilesFolder)
+            reclas1, reclas2, reclas3 = compareCellvalue(raster0, raster1, raster2, raster3, tempFolder, shapefilesFolder, qcConstraints)
             if pd.notna(raster02):
                 #msg("Run compare cell value between 0_2PCT and FVA00")
-                reclas02 = compareCellvalue02(raster0, raster02, tempFolder, shapefilesFolder)
+                reclas02 = compareCellvalue02(raster0, raster02, tempFolder, shapefilesFolder, qcConstraints)
             
             msg('Comparing cell values successfully completed.')
             msg('********************************')
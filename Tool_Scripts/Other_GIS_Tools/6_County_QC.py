@@ -2,6 +2,7 @@ import arcpy
 from sys import argv
 import sys
 import os
+import json
 from arcpy import env
 from arcpy.sa import *
 
@@ -236,10 +237,21 @@ def calculate_grid_values(centerline_qc_points_NFHL, FVA0_Raster):
 
     return centerline_qc_points_NFHL
 
-def Check_QC_Pass_Rate(centerline_qc_points_NFHL):
+def Get_Max_WSEL_Difference():
+    #QC point tolerance is shared with the fix and raster QC tools through Tool_Scripts/FVA_Constraints.json
+    constraints_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "FVA_Constraints.json")
+    if not os.path.exists(constraints_file):
+        arcpy.AddError("Could not find FVA constraints file {0}".format(constraints_file))
+        sys.exit()
+    with open(constraints_file) as f:
+        return json.load(f)["qc_points"]["max_wsel_difference"]
+
+def Check_QC_Pass_Rate(centerline_qc_points_NFHL, max_wsel_difference):
     arcpy.AddMessage(u"\u200B")
     arcpy.AddMessage("##### Assessing QC Point pass rate #####")
 
+    arcpy.AddMessage("QC points fail when WSEL difference is greater than {0} ft".format(max_wsel_difference))
+
     num_handy_qc_points_failed = 0
     num_manual_qc_points_failed = 0
     total_qc_points = 0
@@ -249,12 +261,12 @@ def Check_QC_Pass_Rate(centerline_qc_points_NFHL):
             if row[4] is None: #Delete entry if there is no grid value
                 cursor.deleteRow()
                 continue
-            if row[0] > 0.5:
+            if row[0] > max_wsel_difference:
                 num_handy_qc_points_failed += 1
                 row[2] = "Fail"
             else:
                 row[2] = "Pass"
-            if row[1] > 0.5:
+            if row[1] > max_wsel_difference:
                 num_manual_qc_points_failed += 1
                 row[3] = "Fail"
             else:
@@ -359,6 +371,9 @@ if __name__ == "__main__":
     Tool_Output_Folders = arcpy.GetParameterAsText(1).split(";")
     NFHL_data = arcpy.GetParameterAsText(2)
 
+    #QC point tolerance - read before any processing so a missing constraints file stops the tool early
+    max_wsel_difference = Get_Max_WSEL_Difference()
+
     #Set up environment
     arcpy.env.overwriteOutput = True
     #QC_point_output_location = os.path.dirname(os.path.dirname(os.path.dirname(FFRMS_Geodatabase)))
@@ -396,7 +411,7 @@ if __name__ == "__main__":
     centerline_qc_points_NFHL_projected = calculate_grid_values(centerline_qc_points_NFHL_projected, FVA0_Raster)
 
     #Check QC Pass Rate
-    Check_QC_Pass_Rate(centerline_qc_points_NFHL_projected)
+    Check_QC_Pass_Rate(centerline_qc_points_NFHL_projected, max_wsel_difference)
 
     #Export centerline_qc_points_NFHL to shapefile
     arcpy.AddMessage("Exporting centerline_qc_points_NFHL to shapefile")
@@ -21,6 +21,43 @@ from arcpy import env
 from arcpy.sa import *
 import shutil
 import pandas as pd
+import numpy as np
+import math
+import tempfile
+import multiprocessing
+import concurrent.futures
+import hashlib
+import time
+import re
+from Raster_Signature import Raster_Signature
+
+NODATA_VALUE = -9999999
+
+#Rough processing rates (cells per second) used only for the runtime forecast in Plan_Combine
+ESTIMATED_CELLS_PER_SECOND = {"Standard": 2000000, "Windowed": 6000000, "Single_Pass": 6000000}
+
+#How overlapping HUC8 rasters are resolved. Standard mode passes the mode to the Mosaic tool (except HUC_OWNERSHIP)
+OVERLAP_MODES = ["BLEND", "MEAN", "MAXIMUM", "MINIMUM", "FIRST", "HUC_OWNERSHIP"]
+
+#Scaled integer storage - NoData value and numpy type for each pixel type
+SCALED_INT_NODATA = {"16_BIT_SIGNED": -32768, "32_BIT_SIGNED": -2147483648}
+SCALED_INT_DTYPES = {"16_BIT_SIGNED": np.int16, "32_BIT_SIGNED": np.int32}
+
+#Erase_Areas Yes/No fields - Erase_All_FVAs, the FVA ladder from 00 to 03, then 0_2PCT
+ERASE_FIELDS = ["Erase_All_FVAs", "Erase_00FVA", "Erase_01FVA", "Erase_02FVA", "Erase_03FVA", "Erase_0_2PCT"]
+
+#Rules for aggregating the 3m grid to the 10m product
+AGGREGATION_RULES = ["MEAN", "MAXIMUM", "MINIMUM", "CENTER"]
+
+#Cells within this difference (ft) of the largest seam difference count toward the worst cell bounding box
+SEAM_WORST_TOLERANCE = 0.05
+
+#Spacing (in output cells) of the points projected exactly when warping a raster onto the output grid - cells in between are interpolated
+WARP_CONTROL_SPACING = 64
+
+#BLEND weights stop growing this many cells from a raster edge. Windows where rasters meet are read with a halo this wide,
+#so the weights do not depend on where the window edges fall
+BLEND_DISTANCE = 256
 
 def Check_Source_Data(Tool_Template_Folder):
     arcpy.AddMessage(u"\u200B")
@@ -133,7 +170,110 @@ def Check_Raster_Inputs(Input_rasters, pixel_type_dict):
         # if pixel_type != "9":
         #     arcpy.AddMessage(input_raster + " is not 32_BIT_FLOAT.  Please use only 32_BIT_FLOAT rasters as input.")
 
-def Create_Empty_Raster(FFRMS_Geodatabase, Output_Spatial_Reference, Output_File_Name): 
+def Same_Spatial_Reference(spatial_reference, Output_Spatial_Reference):
+    #Names can match while datums or parameters differ - compare factory codes when both have one, otherwise the full definition
+    if spatial_reference.factoryCode != 0 and Output_Spatial_Reference.factoryCode != 0:
+        return spatial_reference.factoryCode == Output_Spatial_Reference.factoryCode
+    return spatial_reference.exportToString() == Output_Spatial_Reference.exportToString()
+
+def Read_Raster_Header(input_raster, Output_Spatial_Reference):
+    #Header and tag values only - arcpy.Raster does not read pixels until they are requested
+    try:
+        raster = arcpy.Raster(input_raster)
+        spatial_reference = raster.spatialReference
+        output_extent = raster.extent.projectAs(Output_Spatial_Reference)
+        return {"pixel_type": raster.pixelType, "cell_width": raster.meanCellWidth, "cell_height": raster.meanCellHeight,
+                "spatial_reference": spatial_reference.name if spatial_reference != None else "Unknown",
+                "same_spatial_reference": spatial_reference != None and Same_Spatial_Reference(spatial_reference, Output_Spatial_Reference),
+                "xmin": raster.extent.XMin, "ymin": raster.extent.YMin, "nodata": raster.noDataValue,
+                "footprint": {"xmin": output_extent.XMin, "ymin": output_extent.YMin, "xmax": output_extent.XMax, "ymax": output_extent.YMax},
+                "error": None}
+    except Exception as e:
+        return {"error": str(e)}
+
+def Plan_Combine(HUC8_raster_dict, grid, Combine_Mode, window_size, FVAs_to_process):
+    """
+    Preflight check of every tool folder raster before any pixel is read.
+
+    Reads raster headers one at a time (arcpy is not thread safe) and checks pixel type, cell size, spatial reference and
+    alignment with the 3m snap grid. Then reports the planned output grid, the number of cells to process,
+    and estimated memory, disk use and runtime for the chosen combine mode.
+    """
+    arcpy.AddMessage(u"\u200B")
+    arcpy.AddMessage("##### Planning Combine - Checking Raster Headers #####")
+
+    inputs = [(HUC8, FVA, raster_path) for HUC8, FVA_rasters in HUC8_raster_dict.items() for FVA, raster_path in FVA_rasters.items()]
+    if inputs == []:
+        arcpy.AddWarning("No FVA rasters found in tool output folders")
+        return
+
+    start = time.time()
+    headers = [Read_Raster_Header(raster_path, grid["spatial_reference"]) for HUC8, FVA, raster_path in inputs]
+    arcpy.AddMessage("Read {0} raster headers in {1:.1f} seconds".format(len(inputs), time.time() - start))
+
+    cell_size = grid["cell_size"]
+    unreadable, issues = 0, 0
+    for (HUC8, FVA, raster_path), header in zip(inputs, headers):
+        raster_name = "HUC8 {0} {1}".format(HUC8, os.path.basename(raster_path))
+        if header["error"] != None:
+            arcpy.AddError("{0} could not be read: {1}".format(raster_name, header["error"]))
+            unreadable += 1
+            continue
+        if header["pixel_type"] != "F32":
+            arcpy.AddWarning("{0} is {1}, not 32_BIT_FLOAT".format(raster_name, header["pixel_type"]))
+            issues += 1
+        if header["nodata"] == None:
+            arcpy.AddWarning("{0} has no NoData value set".format(raster_name))
+            issues += 1
+        #Cell size, spatial reference and alignment are checked separately so one issue does not hide another
+        if abs(header["cell_width"] - cell_size) > 0.001 or abs(header["cell_height"] - cell_size) > 0.001:
+            arcpy.AddWarning("{0} cell size is {1:.3f} x {2:.3f} - will be resampled to {3}m".format(raster_name, header["cell_width"], header["cell_height"], cell_size))
+            issues += 1
+        if not header["same_spatial_reference"]:
+            arcpy.AddWarning("{0} is in {1} - will be reprojected to {2}".format(raster_name, header["spatial_reference"], grid["spatial_reference"].name))
+            issues += 1
+        #Origin only - cell size has its own check. Rasters in another spatial reference use their footprint in the output spatial reference
+        origin = header if header["same_spatial_reference"] else header["footprint"]
+        if not Is_Aligned_To_Grid({"xmin": origin["xmin"], "ymin": origin["ymin"], "cell_size": cell_size}, grid):
+            arcpy.AddWarning("{0} is not aligned with the {1}m snap grid - will be resampled".format(raster_name, cell_size))
+            issues += 1
+
+    if unreadable > 0:
+        arcpy.AddError("{0} rasters could not be read. Please fix or remove these HUC8s and try again".format(unreadable))
+        sys.exit()
+    arcpy.AddMessage("{0} rasters checked - {1} issues found".format(len(inputs), issues))
+
+    #Forecast - windows touched by at least one raster footprint are the cells that will be processed
+    footprints = [header["footprint"] for header in headers]
+    windows = Create_Windows(grid, window_size)
+    cells_to_process = sum(window["nrows"] * window["ncols"] for window in windows
+                           if any(Window_Overlaps(window, footprint) for footprint in footprints))
+    total_cells = grid["ncols"] * grid["nrows"]
+    FVA_count = len(FVAs_to_process)
+
+    if Combine_Mode == "Single_Pass":
+        memory_bytes = window_size * window_size * (16 * FVA_count + 13)
+    elif Combine_Mode == "Windowed":
+        memory_bytes = window_size * window_size * 20
+    else:
+        memory_bytes = None
+    disk_bytes = cells_to_process * 4 * FVA_count * 0.5 #32 bit float, LZW typically halves WSEL rasters
+    runtime_seconds = cells_to_process * FVA_count / ESTIMATED_CELLS_PER_SECOND.get(Combine_Mode, ESTIMATED_CELLS_PER_SECOND["Standard"])
+
+    arcpy.AddMessage(u"\u200B")
+    arcpy.AddMessage("##### Combine Plan #####")
+    arcpy.AddMessage("Output extent: {0:.0f}, {1:.0f}, {2:.0f}, {3:.0f} ({4})".format(grid["xmin"], grid["ymin"], grid["xmax"], grid["ymax"], grid["spatial_reference"].name))
+    arcpy.AddMessage("Output grid: {0} x {1} cells at {2}m ({3:,} cells)".format(grid["ncols"], grid["nrows"], cell_size, total_cells))
+    arcpy.AddMessage("Cells to process: {0:,} per FVA in {1} windows, {2} FVAs".format(cells_to_process, len(windows), FVA_count))
+    if memory_bytes != None:
+        arcpy.AddMessage("Estimated memory: {0:.0f} MB ({1}x{1} cell windows)".format(memory_bytes / 1000000.0, window_size))
+    else:
+        arcpy.AddMessage("Estimated memory: not bounded - Standard mode uses the Mosaic tool on the full county grid")
+    arcpy.AddMessage("Estimated disk use: {0:.0f} MB".format(disk_bytes / 1000000.0))
+    arcpy.AddMessage("Estimated runtime: {0:.0f} minutes".format(runtime_seconds / 60.0))
+
+def Create_Empty_Raster(FFRMS_Geodatabase, Output_Spatial_Reference, Output_File_Name, Temp_Raster_Name="Temp_Mosaic_Raster",
+                        pyramids="PYRAMIDS -1 NEAREST DEFAULT 75 NO_SKIP NO_SIPS", cell_size=3): 
     arcpy.AddMessage(u"\u200B")
     arcpy.AddMessage("##### Creating Empty Raster Dataset #####")
     #Check to see if file already exists
@@ -141,30 +281,1191 @@ def Create_Empty_Raster(FFRMS_Geodatabase, Output_Spatial_Reference, Output_File
         arcpy.AddMessage("{0} already exists - overwriting existing raster layer".format(Output_File_Name))
         #arcpy.management.Delete(os.path.join(FFRMS_Geodatabase, Output_File_Name))
 
-    #Set up Temp Raster Name based on Output File Name extension (tif, GRID, etc.)
-    Temp_Raster_Name = "Temp_Mosaic_Raster"
+    #Temp Raster Name defaults to Temp_Mosaic_Raster - fused windowed output is created directly under the output name
     Empty_Raster_Dataset = arcpy.management.CreateRasterDataset(out_path=FFRMS_Geodatabase, out_name=Temp_Raster_Name, 
-                                                                 cellsize="3", pixel_type="32_BIT_FLOAT", 
+                                                                 cellsize=str(cell_size), pixel_type="32_BIT_FLOAT", 
                                                                  raster_spatial_reference=Output_Spatial_Reference, number_of_bands=1, 
-                                                                 config_keyword="", pyramids="PYRAMIDS -1 NEAREST DEFAULT 75 NO_SKIP NO_SIPS", 
+                                                                 config_keyword="", pyramids=pyramids, 
                                                                  tile_size="128 128", pyramid_origin="")[0]
     
     return Empty_Raster_Dataset
 
-def Mosaic_Raster(Empty_Raster_Dataset, Input_rasters):
+def Mosaic_Raster(Empty_Raster_Dataset, Input_rasters, mosaictype="BLEND"):
     arcpy.AddMessage(u"\u200B")
     arcpy.AddMessage("##### Mosaicing Rasters #####")
 
-    mosaictype = "BLEND"
     rasters = ";".join(Input_rasters)
 
     Output_Mosaic_Dataset = arcpy.management.Mosaic(inputs=rasters, 
                                                     target=Empty_Raster_Dataset, 
                                                     mosaic_type=mosaictype, colormap="FIRST", background_value="-9999999", nodata_value="-9999999")[0]
 
- 
+
+    return Output_Mosaic_Dataset
+
+def Create_Output_Grid(County_Boundary, Output_Spatial_Reference, cell_size=3):
+    arcpy.AddMessage(u"\u200B")
+    arcpy.AddMessage("##### Determining Output Grid #####")
+
+    #Project county extent to output spatial reference and snap outward to the cell size
+    extent = arcpy.Describe(County_Boundary).extent.projectAs(Output_Spatial_Reference)
+    xmin = math.floor(extent.XMin / cell_size) * cell_size
+    ymin = math.floor(extent.YMin / cell_size) * cell_size
+    xmax = math.ceil(extent.XMax / cell_size) * cell_size
+    ymax = math.ceil(extent.YMax / cell_size) * cell_size
+
+    grid = {"xmin": xmin, "ymin": ymin, "xmax": xmax, "ymax": ymax, "cell_size": cell_size,
+            "ncols": int(round((xmax - xmin) / cell_size)), "nrows": int(round((ymax - ymin) / cell_size)),
+            "spatial_reference": Output_Spatial_Reference}
+
+    arcpy.AddMessage("Output grid is {0} columns by {1} rows at {2}m".format(grid["ncols"], grid["nrows"], cell_size))
+    return grid
+
+def Create_Snap_Raster(grid, scratch_folder):
+    #Single cell raster at the grid origin - used as snap raster so extracted HUC8 rasters land on the output grid
+    snap_raster = os.path.join(scratch_folder, "snap_raster.tif")
+    if not arcpy.Exists(snap_raster):
+        snap_array = np.zeros((1, 1), dtype=np.float32)
+        lower_left = arcpy.Point(grid["xmin"], grid["ymin"])
+        arcpy.NumPyArrayToRaster(snap_array, lower_left, grid["cell_size"], grid["cell_size"]).save(snap_raster)
+        arcpy.management.DefineProjection(snap_raster, grid["spatial_reference"])
+    return snap_raster
+
+def Create_Windows(grid, window_size):
+    #Split the output grid into fixed size windows, working from the top left corner
+    cell_size = grid["cell_size"]
+    windows = []
+    for row_off in range(0, grid["nrows"], window_size):
+        for col_off in range(0, grid["ncols"], window_size):
+            nrows = min(window_size, grid["nrows"] - row_off)
+            ncols = min(window_size, grid["ncols"] - col_off)
+            xmin = grid["xmin"] + col_off * cell_size
+            ymax = grid["ymax"] - row_off * cell_size
+            windows.append({"id": "r{0}_c{1}".format(row_off // window_size, col_off // window_size),
+                            "row_off": row_off, "col_off": col_off, "nrows": nrows, "ncols": ncols,
+                            "xmin": xmin, "ymin": ymax - nrows * cell_size,
+                            "xmax": xmin + ncols * cell_size, "ymax": ymax})
+    return windows
+
+def Get_Raster_Footprints(Input_rasters):
+    #Read extent and cell size from raster headers only - no pixels are read
+    footprints = {}
+    for input_raster in Input_rasters:
+        raster = arcpy.Raster(input_raster)
+        footprints[input_raster] = {"xmin": raster.extent.XMin, "ymin": raster.extent.YMin,
+                                    "xmax": raster.extent.XMax, "ymax": raster.extent.YMax,
+                                    "cell_size": raster.meanCellWidth}
+    return footprints
+
+def Window_Overlaps(window, footprint):
+    return (footprint["xmin"] < window["xmax"] and footprint["xmax"] > window["xmin"] and
+            footprint["ymin"] < window["ymax"] and footprint["ymax"] > window["ymin"])
+
+def Expand_Window(window, halo, cell_size):
+    #Window grown by halo cells on every side - the id is kept, so results cropped back still belong to the window
+    return dict(window, row_off=window["row_off"] - halo, col_off=window["col_off"] - halo,
+                nrows=window["nrows"] + 2 * halo, ncols=window["ncols"] + 2 * halo,
+                xmin=window["xmin"] - halo * cell_size, ymin=window["ymin"] - halo * cell_size,
+                xmax=window["xmax"] + halo * cell_size, ymax=window["ymax"] + halo * cell_size)
+
+def Get_Read_Window(window, footprints, overlap_mode, cell_size):
+    #BLEND windows touched by two or more rasters are read with a BLEND_DISTANCE halo - other windows are read as they are
+    if overlap_mode == "BLEND" and sum(Window_Overlaps(window, footprint) for footprint in footprints) > 1:
+        return Expand_Window(window, BLEND_DISTANCE, cell_size)
+    return window
+
+def Crop_Pieces(pieces, read_window, window, overlap_mode):
+    """
+    Crops pieces read for read_window (the window plus any halo) back to the window.
+
+    For BLEND, the weights of each piece are taken from the whole read window before cropping, so cells near the window
+    edge are weighted by the data beyond it. Returns the indexes of the pieces kept (those reaching into the window),
+    the cropped pieces and their BLEND weights (None for other modes, or when there is nothing to blend).
+    """
+    halo = window["row_off"] - read_window["row_off"]
+    blend = overlap_mode == "BLEND" and len(pieces) > 1
+    kept, cropped, weights = [], [], []
+    for index, (row_start, row_end, col_start, col_end, data) in enumerate(pieces):
+        r0, r1 = max(row_start, halo), min(row_end, halo + window["nrows"])
+        c0, c1 = max(col_start, halo), min(col_end, halo + window["ncols"])
+        if r1 <= r0 or c1 <= c0:
+            continue
+        kept.append(index)
+        cropped.append((r0 - halo, r1 - halo, c0 - halo, c1 - halo, data[r0 - row_start:r1 - row_start, c0 - col_start:c1 - col_start]))
+        if blend:
+            valid = np.zeros((read_window["nrows"], read_window["ncols"]), dtype=bool)
+            valid[row_start:row_end, col_start:col_end] = ~np.isnan(data)
+            weights.append(Blend_Weights(valid)[r0:r1, c0:c1])
+    return kept, cropped, weights if blend else None
+
+def Read_Raster_Window(input_raster, footprint, window, cell_size):
+    #Read the part of a raster that falls within a window. Returns window row/col bounds and the array (NaN = NoData)
+    xmin = max(window["xmin"], footprint["xmin"])
+    xmax = min(window["xmax"], footprint["xmax"])
+    ymin = max(window["ymin"], footprint["ymin"])
+    ymax = min(window["ymax"], footprint["ymax"])
+
+    col_start = int(round((xmin - window["xmin"]) / cell_size))
+    col_end = int(round((xmax - window["xmin"]) / cell_size))
+    row_start = int(round((window["ymax"] - ymax) / cell_size))
+    row_end = int(round((window["ymax"] - ymin) / cell_size))
+    if col_end <= col_start or row_end <= row_start:
+        return None
+
+    lower_left = arcpy.Point(window["xmin"] + col_start * cell_size, window["ymax"] - row_end * cell_size)
+    data = arcpy.RasterToNumPyArray(input_raster, lower_left, col_end - col_start, row_end - row_start, nodata_to_value=np.nan)
+    return row_start, row_end, col_start, col_end, data.astype(np.float32)
+
+def Resolve_Window(pieces, window, overlap_mode="MEAN", piece_owners=None, owner_window=None, piece_weights=None):
+    """
+    Combines the pieces read for one window into a single array.
+
+    Cells covered by one piece are copied straight through. Only the bounding box of cells covered by two or more
+    pieces is resolved with the overlap mode, so windows away from HUC8 seams never run the overlap code.
+    piece_owners gives the HUC8 owner id of each piece and owner_window the owner id of each cell (HUC_OWNERSHIP only).
+    piece_weights gives the weights of each piece from Crop_Pieces (BLEND only).
+    """
+    count = np.zeros((window["nrows"], window["ncols"]), dtype=np.int16)
+    for row_start, row_end, col_start, col_end, data in pieces:
+        count[row_start:row_end, col_start:col_end] += ~np.isnan(data)
+
+    result = np.full((window["nrows"], window["ncols"]), np.nan, dtype=np.float32)
+    for row_start, row_end, col_start, col_end, data in pieces:
+        single = (count[row_start:row_end, col_start:col_end] == 1) & ~np.isnan(data)
+        result[row_start:row_end, col_start:col_end][single] = data[single]
+
+    overlap = count > 1
+    if not overlap.any():
+        return result
+
+    #Resolve overlap cells within their bounding box only
+    rows, cols = np.nonzero(overlap)
+    box = (rows.min(), rows.max() + 1, cols.min(), cols.max() + 1)
+    box_shape = (box[1] - box[0], box[3] - box[2])
+    box_overlap = overlap[box[0]:box[1], box[2]:box[3]]
+    if overlap_mode in ["MEAN", "BLEND"]:
+        accumulator, weight_total = np.zeros(box_shape, dtype=np.float64), np.zeros(box_shape, dtype=np.float64)
+    else:
+        accumulator = np.full(box_shape, np.nan, dtype=np.float32)
+    if overlap_mode == "HUC_OWNERSHIP":
+        box_owner = owner_window[box[0]:box[1], box[2]:box[3]] if owner_window is not None else np.zeros(box_shape, dtype=np.int32)
+
+    for index, (row_start, row_end, col_start, col_end, data) in enumerate(pieces):
+        #Part of the piece inside the overlap box, and where it lands in the box
+        r0, r1, c0, c1 = max(row_start, box[0]), min(row_end, box[1]), max(col_start, box[2]), min(col_end, box[3])
+        if r1 <= r0 or c1 <= c0:
+            continue
+        piece_data = data[r0 - row_start:r1 - row_start, c0 - col_start:c1 - col_start]
+        box_slice = (slice(r0 - box[0], r1 - box[0]), slice(c0 - box[2], c1 - box[2]))
+        valid = ~np.isnan(piece_data)
+
+        if overlap_mode == "MEAN":
+            accumulator[box_slice] += np.where(valid, piece_data, 0)
+            weight_total[box_slice] += valid
+        elif overlap_mode == "BLEND":
+            #Weights come from the whole read window so distances are not cut off at the overlap box or the window edge
+            weights = piece_weights[index][r0 - row_start:r1 - row_start, c0 - col_start:c1 - col_start]
+            accumulator[box_slice] += np.where(valid, piece_data * weights, 0)
+            weight_total[box_slice] += np.where(valid, weights, 0)
+        elif overlap_mode == "MAXIMUM":
+            accumulator[box_slice] = np.fmax(accumulator[box_slice], piece_data)
+        elif overlap_mode == "MINIMUM":
+            accumulator[box_slice] = np.fmin(accumulator[box_slice], piece_data)
+        elif overlap_mode == "HUC_OWNERSHIP":
+            owner_id = piece_owners[index] if piece_owners is not None else None
+            owned = valid & (box_owner[box_slice] == owner_id)
+            accumulator[box_slice][owned] = piece_data[owned]
+
+    if overlap_mode in ["FIRST", "HUC_OWNERSHIP"]:
+        #First piece with data wins - for HUC_OWNERSHIP only where the owning HUC8 has no data
+        for row_start, row_end, col_start, col_end, data in pieces:
+            r0, r1, c0, c1 = max(row_start, box[0]), min(row_end, box[1]), max(col_start, box[2]), min(col_end, box[3])
+            if r1 <= r0 or c1 <= c0:
+                continue
+            region = accumulator[r0 - box[0]:r1 - box[0], c0 - box[2]:c1 - box[2]]
+            fill = np.isnan(region)
+            region[fill] = data[r0 - row_start:r1 - row_start, c0 - col_start:c1 - col_start][fill]
+
+    if overlap_mode in ["MEAN", "BLEND"]:
+        resolved = np.full(box_shape, np.nan, dtype=np.float32)
+        has_weight = weight_total > 0
+        resolved[has_weight] = accumulator[has_weight] / weight_total[has_weight]
+        accumulator = resolved
+
+    result[box[0]:box[1], box[2]:box[3]][box_overlap] = accumulator[box_overlap]
+    return result
+
+def Blend_Weights(valid):
+    """
+    Distance (in cells, up to BLEND_DISTANCE) from each data cell to the nearest NoData cell of the same piece - the
+    same idea as the Mosaic tool BLEND, where a raster counts for less the closer a cell is to its edge.
+
+    valid covers the whole read window, with the window BLEND_DISTANCE cells inside it. The read window edge is not
+    treated as a raster edge: it is padded by repeating its edge cells, and it is far enough from the window that the
+    capped distance of every window cell is the same as for the whole raster.
+    """
+    from scipy import ndimage #Installed with ArcGIS Pro - only needed for BLEND
+    padded = np.pad(valid, 1, mode="edge")
+    distance = ndimage.distance_transform_edt(padded)[1:-1, 1:-1]
+    return np.minimum(distance, BLEND_DISTANCE).astype(np.float32)
+
+def Create_HUC8_Owner_Raster(HUC8_shapefile, County_Boundary, HUC8s, grid, scratch_folder):
+    #Rasterize HUC8 boundaries on the output grid - each cell is owned by the HUC8 it falls in (0 = not in a processed HUC8)
+    arcpy.AddMessage("Rasterizing HUC8 boundaries for HUC_OWNERSHIP overlap mode")
+    if not arcpy.Exists(HUC8_shapefile):
+        arcpy.AddError("No {0} found in Tool Template Files folder. It is required for HUC_OWNERSHIP overlap mode".format(os.path.basename(HUC8_shapefile)))
+        sys.exit()
+
+    HUC8_ids = {HUC8: i + 1 for i, HUC8 in enumerate(sorted(HUC8s))}
+    HUC8_boundaries = r"in_memory\HUC8_Owner_Boundaries"
+    arcpy.analysis.Clip(HUC8_shapefile, County_Boundary, HUC8_boundaries)
+    arcpy.management.AddField(HUC8_boundaries, "OWNER_ID", "SHORT")
+    with arcpy.da.UpdateCursor(HUC8_boundaries, ["huc8", "OWNER_ID"]) as cursor:
+        for row in cursor:
+            row[1] = HUC8_ids.get(str(row[0]), 0)
+            cursor.updateRow(row)
+
+    owner_raster = os.path.join(scratch_folder, "huc8_owner.tif")
+    arcpy.conversion.PolygonToRaster(in_features=HUC8_boundaries, value_field="OWNER_ID", out_rasterdataset=owner_raster,
+                                     cell_assignment="CELL_CENTER", cellsize=grid["cell_size"])
+    arcpy.management.Delete(HUC8_boundaries)
+    return {"raster": owner_raster, "footprint": Get_Raster_Footprints([owner_raster])[owner_raster], "ids": HUC8_ids}
+
+def Read_Owner_Window(huc_owner, window, cell_size):
+    owner_window = np.zeros((window["nrows"], window["ncols"]), dtype=np.int32)
+    if huc_owner is None or not Window_Overlaps(window, huc_owner["footprint"]):
+        return owner_window
+    piece = Read_Raster_Window(huc_owner["raster"], huc_owner["footprint"], window, cell_size)
+    if piece is not None:
+        row_start, row_end, col_start, col_end, data = piece
+        owner_window[row_start:row_end, col_start:col_end] = np.nan_to_num(data)
+    return owner_window
+
+def Get_Raster_HUC8s(Input_rasters):
+    #Extracted rasters carry their HUC8 in the name - Temp_HUC8_Raster_<n>_<HUC8> or <HUC8>_<FVA>.tif
+    raster_HUC8s = {}
+    for input_raster in Input_rasters:
+        match = re.search(r"(\d{8})", os.path.basename(input_raster))
+        raster_HUC8s[input_raster] = match.group(1) if match else None
+    return raster_HUC8s
+
+def Write_Window(result, window, grid, block_folder, block_name, storage=None):
+    #Fused write - round to 0.1 ft, set NoData and save window as compressed GeoTIFF block in one step
+    #Windows without data are skipped. With scaled integer storage the block holds tenths of a foot minus the offset
+    no_data = np.isnan(result)
+    if no_data.all():
+        return None
+
+    block_path = os.path.join(block_folder, "{0}_{1}.tif".format(block_name, window["id"]))
+    if storage != None:
+        nodata_value = storage["nodata"]
+        scaled = Scale_Window(result, storage)
+        #Storage was picked from input statistics, which can be out of date - check the block fits before casting.
+        #The lowest value of the type is the NoData sentinel, so data must stay above it
+        limits = np.iinfo(SCALED_INT_DTYPES[storage["pixel_type"]])
+        low, high = np.nanmin(scaled), np.nanmax(scaled)
+        if low <= limits.min or high > limits.max:
+            arcpy.AddError("Window {0} of {1} has WSEL {2} to {3} ft, outside the {4} bit scaled integer range set from the input raster statistics. "
+                           "Calculate statistics on the input rasters or use Float32 Storage Mode and try again".format(
+                               window["id"], block_name, (low + storage["offset"]) * storage["scale"], (high + storage["offset"]) * storage["scale"], storage["pixel_type"][:2]))
+            sys.exit()
+        block_array = np.where(no_data, nodata_value, scaled).astype(SCALED_INT_DTYPES[storage["pixel_type"]])
+    else:
+        nodata_value = NODATA_VALUE
+        block_array = np.where(no_data, NODATA_VALUE, Round_Window(result)).astype(np.float32)
+    lower_left = arcpy.Point(window["xmin"], window["ymin"])
+    block = arcpy.NumPyArrayToRaster(block_array, lower_left, grid["cell_size"], grid["cell_size"], value_to_nodata=nodata_value)
+    block.save(block_path)
+    arcpy.management.DefineProjection(block_path, grid["spatial_reference"])
+    return block_path
+
+def Windowed_Mosaic_Raster(Empty_Raster_Dataset, Input_rasters, grid, window_size, scratch_folder, overlap_mode="MEAN", huc_owner=None, storage=None,
+                           aggregation_rule=None, seam_windows=None):
+    #Returns the output raster and, when an aggregation rule is given, the 10m blocks aggregated from the same windows
+    #Seam statistics for each window are added to seam_windows when it is given
+    arcpy.AddMessage(u"\u200B")
+    arcpy.AddMessage("##### Mosaicing Rasters by Window #####")
+
+    cell_size = grid["cell_size"]
+    windows = Create_Windows(grid, window_size)
+    sources = Get_Warp_Sources(Input_rasters, grid)
+
+    arcpy.AddMessage("Processing {0} windows of up to {1}x{1} cells (~{2} MB per window)".format(
+        len(windows), window_size, int(window_size * window_size * 16 / 1000000)))
+    arcpy.AddMessage("Overlap mode: {0}".format(overlap_mode))
+
+    #Owner id of each input raster for HUC_OWNERSHIP
+    raster_HUC8s = Get_Raster_HUC8s(Input_rasters)
+    raster_owners = {}
+    if huc_owner is not None:
+        raster_owners = {input_raster: huc_owner["ids"].get(HUC8, -1) for input_raster, HUC8 in raster_HUC8s.items()}
+
+    block_folder = os.path.join(scratch_folder, "blocks")
+    if not os.path.exists(block_folder):
+        os.makedirs(block_folder)
+
+    if storage != None:
+        Save_Storage_Metadata(block_folder, "block", storage)
+
+    grid_10m = Create_10m_Grid(grid)
+    block_list, block_list_10m = [], []
+    for window in windows:
+        #Only read rasters whose footprint touches this window
+        read_window = Get_Read_Window(window, [source["footprint"] for source in sources.values()], overlap_mode, cell_size)
+        pieces, piece_owners, piece_HUC8s = [], [], []
+        for input_raster, source in sources.items():
+            if not Window_Overlaps(read_window, source["footprint"]):
+                continue
+            piece = Read_Source_Window(source, read_window, grid)
+            if piece is not None:
+                pieces.append(piece)
+                piece_owners.append(raster_owners.get(input_raster))
+                piece_HUC8s.append(raster_HUC8s.get(input_raster))
+
+        kept, pieces, piece_weights = Crop_Pieces(pieces, read_window, window, overlap_mode)
+        piece_owners, piece_HUC8s = [piece_owners[i] for i in kept], [piece_HUC8s[i] for i in kept]
+        if pieces == []:
+            continue
+
+        #Seam statistics come from the pieces before the overlap is resolved
+        if seam_windows != None and len(pieces) > 1:
+            seam_windows[window["id"]] = {}
+            Collect_Seam_Statistics(seam_windows[window["id"]], pieces, piece_HUC8s, window, cell_size)
+
+        owner_window = Read_Owner_Window(huc_owner, window, cell_size) if overlap_mode == "HUC_OWNERSHIP" and len(pieces) > 1 else None
+        result = Resolve_Window(pieces, window, overlap_mode, piece_owners, owner_window, piece_weights)
+        block_path = Write_Window(result, window, grid, block_folder, "block", storage)
+        if block_path is not None:
+            block_list.append(block_path)
+
+        #10m product from the window already in memory
+        if aggregation_rule != None:
+            result_10m, window_10m = Aggregate_Window(result, window, grid, aggregation_rule)
+            block_path_10m = Write_Window(result_10m, window_10m, grid_10m, block_folder, "block_10m", storage)
+            if block_path_10m is not None:
+                block_list_10m.append(block_path_10m)
+
+    arcpy.AddMessage("{0} of {1} windows contain data".format(len(block_list), len(windows)))
+    if storage != None:
+        return Mosaic_Scaled_Blocks(Empty_Raster_Dataset, block_list, storage, grid["spatial_reference"]), block_list_10m
+    return Mosaic_Blocks(Empty_Raster_Dataset, block_list), block_list_10m
+
+def Benchmark_Overlap_Modes(Input_rasters, grid, window_size, FFRMS_Geodatabase, Output_Spatial_Reference, Output_Raster_Filename, huc_owner=None):
+    """
+    Times each overlap mode and compares its output with the Mosaic tool BLEND result used by Standard mode.
+
+    The BLEND reference is mosaiced into a temporary raster. Each mode is then run on the windows where HUC8 rasters
+    overlap - window reads are shared, so only the resolve step is timed - and compared with the reference on overlap cells.
+    Results are written to Overlap_Benchmark_<output raster>.csv next to the FFRMS geodatabase.
+    """
+    arcpy.AddMessage(u"\u200B")
+    arcpy.AddMessage("##### Benchmarking Overlap Modes Against Mosaic BLEND #####")
+
+    cell_size = grid["cell_size"]
+    sources = Get_Warp_Sources(Input_rasters, grid)
+    raster_owners = {}
+    if huc_owner is not None:
+        raster_owners = {input_raster: huc_owner["ids"].get(HUC8, -1) for input_raster, HUC8 in Get_Raster_HUC8s(Input_rasters).items()}
+
+    start = time.time()
+    reference_raster = Create_Empty_Raster(FFRMS_Geodatabase, Output_Spatial_Reference, "Temp_Benchmark_Blend", "Temp_Benchmark_Blend")
+    Mosaic_Raster(reference_raster, Input_rasters, "BLEND")
+    reference_seconds = time.time() - start
+    reference_footprint = Get_Raster_Footprints([reference_raster])[reference_raster]
+
+    modes = [mode for mode in OVERLAP_MODES if mode != "HUC_OWNERSHIP" or huc_owner is not None]
+    stats = {mode: {"seconds": 0.0, "cells": 0, "max_diff": 0.0, "sum_diff": 0.0, "over_rounding": 0} for mode in modes}
+    overlap_windows = 0
+    for window in Create_Windows(grid, window_size):
+        #Read with the BLEND halo so BLEND is benchmarked as it runs - the other modes use the same pieces cropped to the window
+        read_window = Get_Read_Window(window, [source["footprint"] for source in sources.values()], "BLEND", cell_size)
+        pieces, piece_owners = [], []
+        for input_raster, source in sources.items():
+            if not Window_Overlaps(read_window, source["footprint"]):
+                continue
+            piece = Read_Source_Window(source, read_window, grid)
+            if piece is not None:
+                pieces.append(piece)
+                piece_owners.append(raster_owners.get(input_raster))
+        crop_start = time.time()
+        kept, pieces, piece_weights = Crop_Pieces(pieces, read_window, window, "BLEND")
+        piece_owners = [piece_owners[i] for i in kept]
+        if len(pieces) < 2:
+            continue
+        blend_weight_seconds = time.time() - crop_start #Weights are part of the BLEND resolve
+
+        count = np.zeros((window["nrows"], window["ncols"]), dtype=np.int16)
+        for row_start, row_end, col_start, col_end, data in pieces:
+            count[row_start:row_end, col_start:col_end] += ~np.isnan(data)
+        overlap = count > 1
+        if not overlap.any():
+            continue
+        overlap_windows += 1
+
+        reference = np.full((window["nrows"], window["ncols"]), np.nan, dtype=np.float32)
+        reference_piece = Read_Raster_Window(reference_raster, reference_footprint, window, cell_size)
+        if reference_piece is not None:
+            row_start, row_end, col_start, col_end, data = reference_piece
+            reference[row_start:row_end, col_start:col_end] = data
+        owner_window = Read_Owner_Window(huc_owner, window, cell_size) if huc_owner is not None else None
+
+        for mode in modes:
+            mode_start = time.time()
+            result = Resolve_Window(pieces, window, mode, piece_owners, owner_window, piece_weights)
+            stats[mode]["seconds"] += time.time() - mode_start + (blend_weight_seconds if mode == "BLEND" else 0)
+
+            difference = np.abs(result[overlap] - reference[overlap])
+            difference = difference[~np.isnan(difference)]
+            if difference.size == 0:
+                continue
+            stats[mode]["cells"] += difference.size
+            stats[mode]["max_diff"] = max(stats[mode]["max_diff"], float(difference.max()))
+            stats[mode]["sum_diff"] += float(difference.sum())
+            stats[mode]["over_rounding"] += int((difference >= 0.05).sum()) #Enough to change the value rounded to 0.1 ft
+
+    arcpy.AddMessage("Mosaic tool BLEND (whole county): {0:.1f} seconds".format(reference_seconds))
+    arcpy.AddMessage("{0} windows contain overlapping HUC8 rasters".format(overlap_windows))
+    rows = []
+    for mode in modes:
+        mean_diff = stats[mode]["sum_diff"] / stats[mode]["cells"] if stats[mode]["cells"] > 0 else 0.0
+        rows.append({"Overlap_Mode": mode, "Resolve_Seconds": round(stats[mode]["seconds"], 2), "Overlap_Cells": stats[mode]["cells"],
+                     "Max_Abs_Diff": round(stats[mode]["max_diff"], 3), "Mean_Abs_Diff": round(mean_diff, 4),
+                     "Cells_Diff_Over_0_05": stats[mode]["over_rounding"]})
+        arcpy.AddMessage("{0}: {1:.2f} seconds, {2:,} overlap cells, max difference {3:.3f}, mean difference {4:.4f}, {5:,} cells differ by 0.05 or more".format(
+            mode, stats[mode]["seconds"], stats[mode]["cells"], stats[mode]["max_diff"], mean_diff, stats[mode]["over_rounding"]))
+    rows.append({"Overlap_Mode": "MOSAIC_BLEND", "Resolve_Seconds": round(reference_seconds, 2), "Overlap_Cells": 0,
+                 "Max_Abs_Diff": 0.0, "Mean_Abs_Diff": 0.0, "Cells_Diff_Over_0_05": 0})
+
+    benchmark_csv = os.path.join(os.path.dirname(FFRMS_Geodatabase), "Overlap_Benchmark_{0}.csv".format(Output_Raster_Filename))
+    pd.DataFrame(rows).to_csv(benchmark_csv, index=False)
+    arcpy.AddMessage("Benchmark saved to {0}".format(benchmark_csv))
+    arcpy.management.Delete(reference_raster)
+
+def Mosaic_Blocks(Empty_Raster_Dataset, block_list):
+    if block_list == []:
+        arcpy.AddWarning("No data found within output grid")
+        return Empty_Raster_Dataset
+
+    #Blocks do not overlap, so LAST simply places each block into the target
+    Output_Mosaic_Dataset = arcpy.management.Mosaic(inputs=";".join(block_list), target=Empty_Raster_Dataset,
+                                                    mosaic_type="LAST", colormap="FIRST",
+                                                    background_value=NODATA_VALUE, nodata_value=NODATA_VALUE)[0]
+
     return Output_Mosaic_Dataset
 
+def Collect_Seam_Statistics(seam_window, pieces, piece_HUC8s, window, cell_size):
+    #Compare each pair of HUC8 pieces where both have data, before the overlap is resolved. Adds stats for this window by HUC8 pair
+    for i in range(len(pieces)):
+        for j in range(i + 1, len(pieces)):
+            if piece_HUC8s[i] == piece_HUC8s[j]:
+                continue
+            row_start, row_end = max(pieces[i][0], pieces[j][0]), min(pieces[i][1], pieces[j][1])
+            col_start, col_end = max(pieces[i][2], pieces[j][2]), min(pieces[i][3], pieces[j][3])
+            if row_end <= row_start or col_end <= col_start:
+                continue
+            data_i = pieces[i][4][row_start - pieces[i][0]:row_end - pieces[i][0], col_start - pieces[i][2]:col_end - pieces[i][2]]
+            data_j = pieces[j][4][row_start - pieces[j][0]:row_end - pieces[j][0], col_start - pieces[j][2]:col_end - pieces[j][2]]
+            difference = np.abs(data_i.astype(np.float64) - data_j)
+            both = ~np.isnan(difference)
+            if not both.any():
+                continue
+
+            values = difference[both]
+            max_diff = float(values.max())
+            rows, cols = np.nonzero(both & (np.nan_to_num(difference) >= max_diff - SEAM_WORST_TOLERANCE))
+            worst_bbox = [float(window["xmin"] + (col_start + cols.min()) * cell_size), float(window["ymax"] - (row_start + rows.max() + 1) * cell_size),
+                          float(window["xmin"] + (col_start + cols.max() + 1) * cell_size), float(window["ymax"] - (row_start + rows.min()) * cell_size)]
+            pair = "|".join(sorted([str(piece_HUC8s[i]), str(piece_HUC8s[j])]))
+            Merge_Seam_Statistics(seam_window, pair, {"cells": int(values.size), "sum_diff": float(values.sum()),
+                                                      "max_diff": max_diff, "worst_bbox": worst_bbox})
+
+def Merge_Seam_Statistics(seam_stats, pair, stats):
+    if pair not in seam_stats:
+        seam_stats[pair] = dict(stats)
+        return
+    current = seam_stats[pair]
+    current["cells"] += stats["cells"]
+    current["sum_diff"] += stats["sum_diff"]
+    if stats["max_diff"] > current["max_diff"] + SEAM_WORST_TOLERANCE:
+        current["max_diff"], current["worst_bbox"] = stats["max_diff"], stats["worst_bbox"]
+    elif stats["max_diff"] >= current["max_diff"] - SEAM_WORST_TOLERANCE:
+        #Worst cells in both - grow the bounding box
+        current["max_diff"] = max(current["max_diff"], stats["max_diff"])
+        current["worst_bbox"] = [min(current["worst_bbox"][0], stats["worst_bbox"][0]), min(current["worst_bbox"][1], stats["worst_bbox"][1]),
+                                 max(current["worst_bbox"][2], stats["worst_bbox"][2]), max(current["worst_bbox"][3], stats["worst_bbox"][3])]
+
+def Save_Seam_Statistics(seam_windows, FVA, FFRMS_Geodatabase, Output_Raster_Filename):
+    """
+    Combines seam statistics from every window and saves them next to the FFRMS geodatabase as
+    <raster name>_Seams.json and .csv - one row per HUC8 pair, worst seams first.
+    """
+    seam_stats = {}
+    for seam_window in seam_windows.values():
+        for pair, stats in seam_window.items():
+            Merge_Seam_Statistics(seam_stats, pair, stats)
+
+    rows = []
+    for pair, stats in seam_stats.items():
+        HUC8_a, HUC8_b = pair.split("|")
+        rows.append({"FVA": FVA, "HUC8_A": HUC8_a, "HUC8_B": HUC8_b, "Overlap_Cells": stats["cells"],
+                     "Max_Abs_Diff": round(stats["max_diff"], 3), "Mean_Abs_Diff": round(stats["sum_diff"] / stats["cells"], 4),
+                     "Worst_XMin": stats["worst_bbox"][0], "Worst_YMin": stats["worst_bbox"][1],
+                     "Worst_XMax": stats["worst_bbox"][2], "Worst_YMax": stats["worst_bbox"][3]})
+    rows.sort(key=lambda row: row["Max_Abs_Diff"], reverse=True)
+
+    seam_path = os.path.join(os.path.dirname(FFRMS_Geodatabase), "{0}_Seams".format(Output_Raster_Filename))
+    with open(seam_path + ".json", "w") as seam_file:
+        json.dump({"raster": Output_Raster_Filename, "FVA": FVA, "seams": rows}, seam_file, indent=1)
+    columns = ["FVA", "HUC8_A", "HUC8_B", "Overlap_Cells", "Max_Abs_Diff", "Mean_Abs_Diff", "Worst_XMin", "Worst_YMin", "Worst_XMax", "Worst_YMax"]
+    pd.DataFrame(rows, columns=columns).to_csv(seam_path + ".csv", index=False)
+
+    arcpy.AddMessage("{0} HUC8 seams found - saved to {1}.csv".format(len(rows), seam_path))
+    for row in rows[:5]:
+        arcpy.AddMessage("HUC8 {0} / {1}: {2:,} overlap cells, max difference {3:.2f} ft, mean difference {4:.3f} ft".format(
+            row["HUC8_A"], row["HUC8_B"], row["Overlap_Cells"], row["Max_Abs_Diff"], row["Mean_Abs_Diff"]))
+
+def Create_10m_Grid(grid):
+    #10m grid shares the 3m grid's upper left corner. With window sizes a multiple of 10 cells, every 3m window is a whole number of 10m cells
+    ncols = int(math.floor((grid["ncols"] - 0.5) * grid["cell_size"] / 10.0)) + 1
+    nrows = int(math.floor((grid["nrows"] - 0.5) * grid["cell_size"] / 10.0)) + 1
+    return {"xmin": grid["xmin"], "ymin": grid["ymax"] - nrows * 10, "xmax": grid["xmin"] + ncols * 10, "ymax": grid["ymax"],
+            "cell_size": 10, "ncols": ncols, "nrows": nrows, "spatial_reference": grid["spatial_reference"]}
+
+def Aggregate_Window(result, window, grid, aggregation_rule):
+    """
+    Aggregates a resolved 3m window to 10m before it is rounded.
+
+    10m is not a whole number of 3m cells, so each 3m cell goes to the 10m cell its center falls in (3 or 4 cells per
+    row and column). MEAN, MAXIMUM and MINIMUM ignore NoData cells - a 10m cell has data if any of its 3m cells do.
+    CENTER takes the 3m cell under the 10m cell center. Returns the 10m array and its window.
+    """
+    cell_size = grid["cell_size"]
+    row_groups = np.floor((np.arange(window["nrows"]) + 0.5) * cell_size / 10.0).astype(np.int64)
+    col_groups = np.floor((np.arange(window["ncols"]) + 0.5) * cell_size / 10.0).astype(np.int64)
+    nrows, ncols = row_groups[-1] + 1, col_groups[-1] + 1
+    window_10m = {"id": window["id"], "nrows": nrows, "ncols": ncols, "xmin": window["xmin"], "xmax": window["xmin"] + ncols * 10,
+                  "ymin": window["ymax"] - nrows * 10, "ymax": window["ymax"]}
+
+    if aggregation_rule == "CENTER":
+        center_rows = np.minimum(np.floor((np.arange(nrows) + 0.5) * 10.0 / cell_size).astype(np.int64), window["nrows"] - 1)
+        center_cols = np.minimum(np.floor((np.arange(ncols) + 0.5) * 10.0 / cell_size).astype(np.int64), window["ncols"] - 1)
+        return result[np.ix_(center_rows, center_cols)], window_10m
+
+    #Groups are contiguous runs of rows and columns, so reduceat aggregates them without building index arrays
+    row_starts = np.concatenate(([0], np.flatnonzero(np.diff(row_groups)) + 1))
+    col_starts = np.concatenate(([0], np.flatnonzero(np.diff(col_groups)) + 1))
+    if aggregation_rule == "MEAN":
+        valid = ~np.isnan(result)
+        total = np.add.reduceat(np.add.reduceat(np.where(valid, result.astype(np.float64), 0), col_starts, axis=1), row_starts, axis=0)
+        count = np.add.reduceat(np.add.reduceat(valid.astype(np.int32), col_starts, axis=1), row_starts, axis=0)
+        result_10m = np.full((nrows, ncols), np.nan, dtype=np.float32)
+        result_10m[count > 0] = total[count > 0] / count[count > 0]
+        return result_10m, window_10m
+
+    reduce = np.fmax if aggregation_rule == "MAXIMUM" else np.fmin
+    return reduce.reduceat(reduce.reduceat(result, col_starts, axis=1), row_starts, axis=0), window_10m
+
+def Mosaic_Output_Blocks(FFRMS_Geodatabase, Output_Spatial_Reference, Output_Raster_Filename, block_list, storage=None,
+                         pyramids="PYRAMIDS -1 NEAREST DEFAULT 75 NO_SKIP NO_SIPS", cell_size=3):
+    #Blocks are already rounded and masked - mosaic them straight into the output raster. Scaled integer blocks are converted on the way
+    if storage != None:
+        return Mosaic_Scaled_Blocks(os.path.join(FFRMS_Geodatabase, Output_Raster_Filename), block_list, storage, Output_Spatial_Reference, cell_size)
+    Output_Dataset = Create_Empty_Raster(FFRMS_Geodatabase, Output_Spatial_Reference, Output_Raster_Filename, Output_Raster_Filename, pyramids, cell_size)
+    return Mosaic_Blocks(Output_Dataset, block_list)
+
+def Get_Scaled_Storage(Input_rasters):
+    """
+    Picks integer storage for WSEL rounded to 0.1 ft. Stored value = WSEL * 10 - offset, so WSEL = (value + offset) * scale.
+
+    16 bit is used when the input raster statistics show the WSEL range fits, with the offset at the middle of the range.
+    Otherwise, or when an input has no statistics, 32 bit with no offset. Write_Window stops the tool if a block does not fit.
+    """
+    storage = {"scale": 0.1, "offset": 0, "pixel_type": "32_BIT_SIGNED", "nodata": SCALED_INT_NODATA["32_BIT_SIGNED"]}
+    minimum, maximum = None, None
+    for input_raster in Input_rasters:
+        raster = arcpy.Raster(input_raster)
+        if raster.minimum == None or raster.maximum == None:
+            return storage
+        minimum = raster.minimum if minimum == None else min(minimum, raster.minimum)
+        maximum = raster.maximum if maximum == None else max(maximum, raster.maximum)
+    if minimum == None:
+        return storage
+
+    low, high = int(math.floor(minimum * 10)) - 1, int(math.ceil(maximum * 10)) + 1
+    if high - low < 65534:
+        storage.update({"offset": (low + high) // 2, "pixel_type": "16_BIT_SIGNED", "nodata": SCALED_INT_NODATA["16_BIT_SIGNED"]})
+    return storage
+
+def Scale_Window(result, storage):
+    #Same rounding as Round_Window, kept as integer tenths of a foot
+    return np.trunc(result.astype(np.float64) * 10 + 0.5) - storage["offset"]
+
+def Save_Storage_Metadata(block_folder, block_name, storage):
+    #Scale/offset sidecar for scaled integer blocks - WSEL = (value + offset) * scale
+    with open(os.path.join(block_folder, "{0}_scale_offset.json".format(block_name)), "w") as metadata_file:
+        json.dump(storage, metadata_file, indent=1)
+
+def Mosaic_Scaled_Blocks(Output_Raster, block_list, storage, spatial_reference, cell_size=3):
+    """
+    Float32 output path for scaled integer blocks.
+
+    Blocks are mosaiced into a temporary integer raster, then converted to 32 bit float WSEL in one pass. Tenths of a foot
+    are whole numbers in the integer raster, so the float output matches Float32 storage mode cell for cell.
+    """
+    if block_list == []:
+        arcpy.AddWarning("No data found within output grid")
+        return Create_Empty_Raster(os.path.dirname(Output_Raster), spatial_reference, os.path.basename(Output_Raster), os.path.basename(Output_Raster),
+                                   cell_size=cell_size)
+
+    arcpy.AddMessage("Mosaicing {0} bit scaled integer blocks (offset {1} tenths)".format(storage["pixel_type"][:2], storage["offset"]))
+    FFRMS_Geodatabase = os.path.dirname(Output_Raster)
+    scaled_raster = arcpy.management.CreateRasterDataset(out_path=FFRMS_Geodatabase, out_name="Temp_Scaled_Mosaic", cellsize=str(cell_size),
+                                                         pixel_type=storage["pixel_type"], raster_spatial_reference=spatial_reference,
+                                                         number_of_bands=1, pyramids="NONE")[0]
+    arcpy.management.Mosaic(inputs=";".join(block_list), target=scaled_raster, mosaic_type="LAST", colormap="FIRST",
+                            background_value=storage["nodata"], nodata_value=storage["nodata"])
+
+    #Divide by 10 rather than multiply by the scale so values match Round_Window exactly
+    arcpy.AddMessage("Converting to 32 bit float WSEL")
+    wsel = (Float(Raster(scaled_raster)) + storage["offset"]) / int(round(1 / storage["scale"]))
+    arcpy.management.CopyRaster(wsel, Output_Raster, nodata_value=NODATA_VALUE, pixel_type="32_BIT_FLOAT")
+    arcpy.management.Delete(scaled_raster)
+    return Output_Raster
+
+def Is_Aligned_To_Grid(footprint, grid):
+    cell_size = grid["cell_size"]
+    offset_x = (footprint["xmin"] - grid["xmin"]) / cell_size
+    offset_y = (footprint["ymin"] - grid["ymin"]) / cell_size
+    return abs(footprint["cell_size"] - cell_size) <= 0.001 and abs(offset_x - round(offset_x)) <= 0.01 and abs(offset_y - round(offset_y)) <= 0.01
+
+def Get_Warp_Source(input_raster, grid):
+    """
+    Reads a raster header and works out how its windows will be read onto the output grid.
+
+    Rasters already on the output grid (same spatial reference, cell size and snap) are read in place. Others are
+    warped one window at a time by Warp_Raster_Window - no projected copy of the raster is written. The footprint is
+    always in the output spatial reference so it can be checked against output windows.
+    """
+    raster = arcpy.Raster(input_raster)
+    source_spatial_reference = raster.spatialReference
+    native = {"xmin": raster.extent.XMin, "ymin": raster.extent.YMin, "xmax": raster.extent.XMax, "ymax": raster.extent.YMax,
+              "cell_size": raster.meanCellWidth, "cell_width": raster.meanCellWidth, "cell_height": raster.meanCellHeight,
+              "ncols": raster.width, "nrows": raster.height}
+    same_spatial_reference = Same_Spatial_Reference(source_spatial_reference, grid["spatial_reference"])
+    if same_spatial_reference and abs(native["cell_height"] - native["cell_width"]) <= 0.001 and Is_Aligned_To_Grid(native, grid):
+        return {"raster": input_raster, "footprint": native, "aligned": True}
+
+    output_extent = raster.extent if same_spatial_reference else raster.extent.projectAs(grid["spatial_reference"])
+    transformations = [] if same_spatial_reference else arcpy.ListTransformations(grid["spatial_reference"], source_spatial_reference)
+    return {"raster": input_raster, "aligned": False, "native": native, "spatial_reference": source_spatial_reference,
+            "transformation": transformations[0] if transformations else None,
+            "footprint": {"xmin": output_extent.XMin, "ymin": output_extent.YMin, "xmax": output_extent.XMax, "ymax": output_extent.YMax,
+                          "cell_size": grid["cell_size"]}}
+
+def Interpolate_Control_Grid(values, control_rows, control_cols, nrows, ncols):
+    #Bilinear interpolation of control point values to every cell - across each control row, then down each column
+    across = np.array([np.interp(np.arange(ncols), control_cols, row_values) for row_values in values])
+    if len(control_rows) == 1:
+        return np.repeat(across, nrows, axis=0)
+    rows = np.arange(nrows)
+    lower = np.clip(np.searchsorted(control_rows, rows, side="right") - 1, 0, len(control_rows) - 2)
+    fraction = ((rows - control_rows[lower]) / (control_rows[lower + 1] - control_rows[lower]))[:, None]
+    return across[lower] * (1 - fraction) + across[lower + 1] * fraction
+
+def Warp_Raster_Window(source, window, grid):
+    """
+    Resamples the part of a raster under one output window onto the output grid (nearest neighbour).
+
+    Output cell centers on a coarse control grid are projected to the raster's spatial reference in a single call, and
+    the source location of every other cell is interpolated between them. Only the source block under the window is read.
+    Returns a piece in the same form as Read_Raster_Window.
+    """
+    cell_size = grid["cell_size"]
+    native = source["native"]
+    control_cols = np.unique(np.append(np.arange(0, window["ncols"], WARP_CONTROL_SPACING), window["ncols"] - 1))
+    control_rows = np.unique(np.append(np.arange(0, window["nrows"], WARP_CONTROL_SPACING), window["nrows"] - 1))
+    points = arcpy.Array([arcpy.Point(window["xmin"] + (col + 0.5) * cell_size, window["ymax"] - (row + 0.5) * cell_size)
+                          for row in control_rows for col in control_cols])
+    control_points = arcpy.Multipoint(points, grid["spatial_reference"])
+    if source["transformation"] != None:
+        control_points = control_points.projectAs(source["spatial_reference"], source["transformation"])
+    elif not Same_Spatial_Reference(source["spatial_reference"], grid["spatial_reference"]):
+        control_points = control_points.projectAs(source["spatial_reference"])
+    coordinates = np.array([[point.X, point.Y] for point in control_points.getPart()]).reshape(len(control_rows), len(control_cols), 2)
+
+    source_x = Interpolate_Control_Grid(coordinates[:, :, 0], control_rows, control_cols, window["nrows"], window["ncols"])
+    source_y = Interpolate_Control_Grid(coordinates[:, :, 1], control_rows, control_cols, window["nrows"], window["ncols"])
+    source_cols = np.floor((source_x - native["xmin"]) / native["cell_width"]).astype(np.int64)
+    source_rows = np.floor((native["ymax"] - source_y) / native["cell_height"]).astype(np.int64)
+    inside = (source_cols >= 0) & (source_cols < native["ncols"]) & (source_rows >= 0) & (source_rows < native["nrows"])
+    if not inside.any():
+        return None
+
+    #Crop to the window cells that fall on the raster, then read the source block beneath them once
+    rows, cols = np.nonzero(inside)
+    row_start, row_end, col_start, col_end = rows.min(), rows.max() + 1, cols.min(), cols.max() + 1
+    inside = inside[row_start:row_end, col_start:col_end]
+    source_cols = source_cols[row_start:row_end, col_start:col_end][inside]
+    source_rows = source_rows[row_start:row_end, col_start:col_end][inside]
+    first_col, last_col, first_row, last_row = source_cols.min(), source_cols.max(), source_rows.min(), source_rows.max()
+    lower_left = arcpy.Point(native["xmin"] + first_col * native["cell_width"], native["ymax"] - (last_row + 1) * native["cell_height"])
+    block = arcpy.RasterToNumPyArray(source["raster"], lower_left, last_col - first_col + 1, last_row - first_row + 1, nodata_to_value=np.nan)
+
+    data = np.full(inside.shape, np.nan, dtype=np.float32)
+    data[inside] = block[source_rows - first_row, source_cols - first_col]
+    return row_start, row_end, col_start, col_end, data
+
+def Read_Source_Window(source, window, grid):
+    #Rasters on the output grid are read by cell offset, others are warped as they are read
+    if source["aligned"]:
+        return Read_Raster_Window(source["raster"], source["footprint"], window, grid["cell_size"])
+    return Warp_Raster_Window(source, window, grid)
+
+def Get_Warp_Sources(Input_rasters, grid):
+    sources = {input_raster: Get_Warp_Source(input_raster, grid) for input_raster in Input_rasters}
+    for input_raster, source in sources.items():
+        if not source["aligned"]:
+            arcpy.AddMessage("{0} is not on the {1}m output grid - resampling while windows are read".format(os.path.basename(input_raster), grid["cell_size"]))
+    return sources
+
+def Find_Raster_In_Folder(tool_folder_files, tool_folder, raster_name):
+    #Prefer exact name match so 'wsel_grid_0' does not pick up 'wsel_grid_02_pct_0'
+    tif_files = [file for file in tool_folder_files if file.endswith(".tif") or file.endswith(".tiff")]
+    for file in tif_files:
+        if os.path.splitext(file)[0] == raster_name:
+            return os.path.join(tool_folder, file)
+    for file in tif_files:
+        if raster_name in file:
+            return os.path.join(tool_folder, file)
+    return None
+
+def Resolve_Tool_Folder(tool_folder):
+    tool_folder = tool_folder.replace("'","") #Fixes One-Drive folder naming 
+
+    #Check for extra subfolder level - can be caused by unzipping to folder with same name
+    for folder in os.listdir(tool_folder):
+        if os.path.basename(folder) == os.path.basename(tool_folder):
+            tool_folder = os.path.join(tool_folder, os.path.basename(folder))
+    return tool_folder
+
+def Index_Tool_Output_Folders(Tool_Output_Folders, raster_names, index_path, Output_Spatial_Reference):
+    """
+    Builds or refreshes the persistent index of HANDy tool output folders.
+
+    For each tool folder the index keeps the resolved folder path and its tif files, and for each grid name the raster
+    path, size, mtime and footprint in the output spatial reference. A folder is only listed again when its mtime
+    changes, and a footprint is only read again when the raster size or mtime changes.
+    """
+    index = Load_Manifest(index_path) or {}
+    listed, refreshed = 0, 0
+    for tool_folder in Tool_Output_Folders:
+        entry = index.get(tool_folder)
+        if entry == None or not os.path.isdir(entry["folder"]) or os.path.getmtime(entry["folder"]) != entry["folder_mtime"]:
+            resolved_folder = Resolve_Tool_Folder(tool_folder)
+            entry = {"HUC8": os.path.basename(resolved_folder)[:8], "folder": resolved_folder, "folder_mtime": os.path.getmtime(resolved_folder),
+                     "files": [file for file in os.listdir(resolved_folder) if file.endswith(".tif") or file.endswith(".tiff")],
+                     "rasters": entry["rasters"] if entry != None else {}}
+            listed += 1
+
+        for raster_name in raster_names:
+            raster_path = Find_Raster_In_Folder(entry["files"], entry["folder"], raster_name)
+            if raster_path == None:
+                entry["rasters"].pop(raster_name, None)
+                continue
+            stat = os.stat(raster_path)
+            cached = entry["rasters"].get(raster_name)
+            if (cached == None or cached["path"] != raster_path or cached["size"] != stat.st_size or cached["mtime"] != stat.st_mtime or
+                cached["spatial_reference"] != Output_Spatial_Reference.name):
+                cached = {"path": raster_path, "size": stat.st_size, "mtime": stat.st_mtime, "spatial_reference": Output_Spatial_Reference.name,
+                          "footprint": Get_Output_Footprint(raster_path, Output_Spatial_Reference)}
+                refreshed += 1
+            entry["rasters"][raster_name] = cached
+        index[tool_folder] = entry
+
+    Save_Manifest(index_path, index)
+    arcpy.AddMessage("Tool folder index: {0} of {1} folders listed, {2} raster footprints read".format(listed, len(Tool_Output_Folders), refreshed))
+    return index
+
+def Find_HUC8_Rasters(Tool_Output_Folders, FVAs_to_process, raster_dict, index_path, grid):
+    arcpy.AddMessage(u"\u200B")
+    arcpy.AddMessage("##### Finding FVA Rasters in Tool Output Folders #####")
+
+    #Look up every FVA raster in the tool folder index - rasters that miss the county are dropped before any pixels are read
+    index = Index_Tool_Output_Folders(Tool_Output_Folders, [raster_dict[FVA] for FVA in FVAs_to_process], index_path, grid["spatial_reference"])
+    HUC8_raster_dict = {}
+    for tool_folder in Tool_Output_Folders:
+        entry = index[tool_folder]
+        HUC8 = entry["HUC8"]
+        HUC8_raster_dict[HUC8] = {}
+        for FVA in FVAs_to_process:
+            cached = entry["rasters"].get(raster_dict[FVA])
+            if cached == None:
+                arcpy.AddMessage("No {0} raster found in {1}".format(raster_dict[FVA], os.path.basename(entry["folder"])))
+                continue
+            if not Window_Overlaps(grid, cached["footprint"]):
+                arcpy.AddMessage("{0} raster in {1} is outside the county - skipping".format(raster_dict[FVA], os.path.basename(entry["folder"])))
+                continue
+            HUC8_raster_dict[HUC8][FVA] = cached["path"]
+
+        arcpy.AddMessage("HUC8 {0}: found {1}".format(HUC8, ", ".join(HUC8_raster_dict[HUC8].keys())))
+
+    return HUC8_raster_dict
+
+def Create_County_Mask_Raster(County_Boundary, grid, scratch_folder):
+    #Rasterize the county boundary once on the output grid - shared by every HUC8 and FVA
+    county_mask = os.path.join(scratch_folder, "county_mask.tif")
+    oid_field = arcpy.Describe(County_Boundary).OIDFieldName
+    arcpy.conversion.PolygonToRaster(in_features=County_Boundary, value_field=oid_field, out_rasterdataset=county_mask,
+                                     cell_assignment="CELL_CENTER", cellsize=grid["cell_size"])
+    return county_mask
+
+def Create_Erase_Level_Rasters(HUC8, Erase_Area_Feature, grid, scratch_folder, mask_cache=None):
+    """
+    Rasterizes Erase_Areas once per HUC8 instead of once per FVA.
+
+    ERASE_LEVEL is the number of ladder FVAs (00-03) erased by a feature. Check_Erase_Areas cascades 'Y' values
+    down the ladder, so a cell is erased for FVA index i when ERASE_LEVEL > i. Overlapping features keep the
+    highest level. 0.2PCT is not part of the ladder and gets its own raster.
+    """
+    output_folder = scratch_folder
+    level_name, pct_name = "erase_level_{0}.tif".format(HUC8), "erase_pct_{0}.tif".format(HUC8)
+    if mask_cache != None:
+        #Cached by erase feature content - key uses every erase feature since levels cover all FVAs
+        erase_hash = Hash_Erase_Features(Erase_Area_Feature, None, mask_cache)
+        output_folder = mask_cache["cache_folder"]
+        level_name = "{0}_{1}_LEVEL_{2}.tif".format(mask_cache["FIPS_code"], HUC8, erase_hash)
+        pct_name = "{0}_{1}_PCT_{2}.tif".format(mask_cache["FIPS_code"], HUC8, erase_hash)
+        if arcpy.Exists(os.path.join(output_folder, level_name)):
+            arcpy.AddMessage("Using cached erase rasters for HUC8 {0}".format(HUC8))
+            pct_raster = os.path.join(output_folder, pct_name)
+            return os.path.join(output_folder, level_name), (pct_raster if arcpy.Exists(pct_raster) else None)
+
+    erase_levels = r"in_memory\Erase_Levels_{0}".format(HUC8)
+    arcpy.management.CopyFeatures(Erase_Area_Feature, erase_levels)
+    arcpy.management.AddField(erase_levels, "ERASE_LEVEL", "SHORT")
+    arcpy.management.AddField(erase_levels, "ERASE_PCT", "SHORT")
+
+    fields = ["Erase_All_FVAs", "Erase_00FVA", "Erase_01FVA", "Erase_02FVA", "Erase_03FVA", "Erase_0_2PCT", "ERASE_LEVEL", "ERASE_PCT"]
+    pct_count = 0
+    with arcpy.da.UpdateCursor(erase_levels, fields) as cursor:
+        for row in cursor:
+            level = 0
+            for i in range(1, 5):
+                if row[i] == "Y":
+                    level = i
+            if row[0] == "Y":
+                level = 4
+            row[6] = level
+            row[7] = 1 if (row[0] == "Y" or row[5] == "Y") else 0
+            pct_count += row[7]
+            cursor.updateRow(row)
+
+    #0.2PCT raster is written before the level raster, which marks the cache entry as complete. Both are written under a
+    #partial name first so an interrupted run never leaves a bad cache entry
+    pct_raster = None
+    if pct_count > 0:
+        arcpy.management.MakeFeatureLayer(erase_levels, "Erase_PCT_subset", "ERASE_PCT = 1")
+        pct_raster = os.path.join(output_folder, pct_name)
+        partial_raster = pct_raster.replace(".tif", "_partial.tif")
+        arcpy.conversion.PolygonToRaster(in_features="Erase_PCT_subset", value_field="ERASE_PCT", out_rasterdataset=partial_raster,
+                                         cell_assignment="CELL_CENTER", cellsize=grid["cell_size"])
+        arcpy.management.Rename(partial_raster, pct_raster)
+        arcpy.management.Delete("Erase_PCT_subset")
+
+    level_raster = os.path.join(output_folder, level_name)
+    partial_raster = level_raster.replace(".tif", "_partial.tif")
+    arcpy.conversion.PolygonToRaster(in_features=erase_levels, value_field="ERASE_LEVEL", out_rasterdataset=partial_raster,
+                                     cell_assignment="CELL_CENTER", priority_field="ERASE_LEVEL", cellsize=grid["cell_size"])
+    arcpy.management.Rename(partial_raster, level_raster)
+
+    arcpy.management.Delete(erase_levels)
+    return level_raster, pct_raster
+
+def Keep_Mask(FVA, level_data, pct_data):
+    #True where a HUC8 cell survives the erase areas for this FVA
+    if FVA == "0_2PCT":
+        return ~(pct_data > 0)
+    FVA_index = int(FVA[:2])
+    return ~(level_data > FVA_index)
+
+def Single_Pass_Combine(HUC8_raster_dict, HUC8_erase_area_dict, FVAs_to_process, County_Boundary, grid, window_size, scratch_folder, mask_cache=None,
+                        block_folders=None, dirty_windows=None, overlap_mode="MEAN", huc_owner=None, storages=None, aggregation_rule=None,
+                        seam_windows=None):
+    #Returns the 3m block list for each FVA and, when an aggregation rule is given, the 10m block list aggregated from the same windows
+    #Seam statistics for each FVA and window are added to seam_windows when it is given - windows that are rebuilt replace their old entry
+    arcpy.AddMessage(u"\u200B")
+    arcpy.AddMessage("##### Combining All FVAs in a Single Pass #####")
+
+    cell_size = grid["cell_size"]
+    county_mask = Create_County_Mask_Raster(County_Boundary, grid, scratch_folder)
+    county_footprint = Get_Raster_Footprints([county_mask])[county_mask]
+
+    #Prepare each HUC8 once - raster footprints and one set of erase rasters shared by all FVAs
+    HUC8_inputs = {}
+    for HUC8, FVA_rasters in HUC8_raster_dict.items():
+        if FVA_rasters == {}:
+            continue
+        arcpy.AddMessage("## Preparing HUC8 {0} ##".format(HUC8))
+        inputs = {"rasters": {}, "erase": []}
+        for FVA, raster_path in FVA_rasters.items():
+            inputs["rasters"][FVA] = Get_Warp_Source(raster_path, grid)
+            if not inputs["rasters"][FVA]["aligned"]:
+                arcpy.AddMessage("{0} is not on the {1}m output grid - resampling while windows are read".format(os.path.basename(raster_path), cell_size))
+        footprints = [source["footprint"] for source in inputs["rasters"].values()]
+        inputs["footprint"] = {"xmin": min(footprint["xmin"] for footprint in footprints), "ymin": min(footprint["ymin"] for footprint in footprints),
+                               "xmax": max(footprint["xmax"] for footprint in footprints), "ymax": max(footprint["ymax"] for footprint in footprints)}
+
+        if HUC8 in HUC8_erase_area_dict:
+            arcpy.AddMessage("Rasterizing Erase_Areas for HUC8 {0}".format(HUC8))
+            level_raster, pct_raster = Create_Erase_Level_Rasters(HUC8, HUC8_erase_area_dict[HUC8], grid, scratch_folder, mask_cache)
+            inputs["erase"] = [raster for raster in [level_raster, pct_raster] if raster is not None]
+            inputs["level_raster"], inputs["pct_raster"] = level_raster, pct_raster
+            inputs["erase_footprints"] = Get_Raster_Footprints(inputs["erase"])
+        else:
+            arcpy.AddMessage("No Erase_Area feature given for HUC8 {0}".format(HUC8))
+        HUC8_inputs[HUC8] = inputs
+
+    windows = Create_Windows(grid, window_size)
+    arcpy.AddMessage("Processing {0} windows of up to {1}x{1} cells for {2} FVAs".format(len(windows), window_size, len(FVAs_to_process)))
+    arcpy.AddMessage("Overlap mode: {0}".format(overlap_mode))
+
+    #Incremental runs write to the persistent block store - otherwise blocks go to scratch
+    if block_folders == None:
+        block_folders = {FVA: os.path.join(scratch_folder, "blocks") for FVA in FVAs_to_process}
+    for block_folder in block_folders.values():
+        if not os.path.exists(block_folder):
+            os.makedirs(block_folder)
+    if storages != None:
+        for FVA in FVAs_to_process:
+            Save_Storage_Metadata(block_folders[FVA], FVA, storages[FVA])
+
+    grid_10m = Create_10m_Grid(grid)
+    block_lists = {FVA: [] for FVA in FVAs_to_process}
+    block_lists_10m = {FVA: [] for FVA in FVAs_to_process}
+    for window in windows:
+        window_FVAs = FVAs_to_process
+        if dirty_windows != None:
+            window_FVAs = [FVA for FVA in FVAs_to_process if window["id"] in dirty_windows[FVA]]
+            if window_FVAs == []:
+                continue
+        if seam_windows != None:
+            for FVA in window_FVAs:
+                seam_windows[FVA].pop(window["id"], None)
+
+        #County mask and erase areas are read for the whole read window, so BLEND weights see erased edges beyond the window
+        read_window = Get_Read_Window(window, [inputs["footprint"] for inputs in HUC8_inputs.values()], overlap_mode, cell_size)
+        halo = window["row_off"] - read_window["row_off"]
+        county_piece = Read_Raster_Window(county_mask, county_footprint, read_window, cell_size)
+        if county_piece is None:
+            continue
+        county_window = np.zeros((read_window["nrows"], read_window["ncols"]), dtype=bool)
+        row_start, row_end, col_start, col_end, data = county_piece
+        county_window[row_start:row_end, col_start:col_end] = ~np.isnan(data)
+        if not county_window[halo:halo + window["nrows"], halo:halo + window["ncols"]].any():
+            continue
+
+        pieces = {FVA: [] for FVA in window_FVAs}
+        piece_owners = {FVA: [] for FVA in window_FVAs}
+        piece_HUC8s = {FVA: [] for FVA in window_FVAs}
+        for HUC8, inputs in HUC8_inputs.items():
+            overlapping = [FVA for FVA, source in inputs["rasters"].items() if FVA in window_FVAs and Window_Overlaps(read_window, source["footprint"])]
+            if overlapping == []:
+                continue
+
+            #Read erase rasters once per HUC8 per window
+            level_window = np.zeros((read_window["nrows"], read_window["ncols"]), dtype=np.float32)
+            pct_window = np.zeros((read_window["nrows"], read_window["ncols"]), dtype=np.float32)
+            for erase_raster, erase_window in [(inputs.get("level_raster"), level_window), (inputs.get("pct_raster"), pct_window)]:
+                if erase_raster is None or not Window_Overlaps(read_window, inputs["erase_footprints"][erase_raster]):
+                    continue
+                erase_piece = Read_Raster_Window(erase_raster, inputs["erase_footprints"][erase_raster], read_window, cell_size)
+                if erase_piece is not None:
+                    row_start, row_end, col_start, col_end, data = erase_piece
+                    erase_window[row_start:row_end, col_start:col_end] = np.nan_to_num(data)
+
+            for FVA in overlapping:
+                piece = Read_Source_Window(inputs["rasters"][FVA], read_window, grid)
+                if piece is None:
+                    continue
+                row_start, row_end, col_start, col_end, data = piece
+                keep = county_window[row_start:row_end, col_start:col_end] & Keep_Mask(FVA, level_window[row_start:row_end, col_start:col_end], pct_window[row_start:row_end, col_start:col_end])
+                pieces[FVA].append((row_start, row_end, col_start, col_end, np.where(keep, data, np.nan)))
+                piece_owners[FVA].append(huc_owner["ids"].get(HUC8, -1) if huc_owner is not None else None)
+                piece_HUC8s[FVA].append(HUC8)
+
+        piece_weights = {}
+        for FVA in window_FVAs:
+            kept, pieces[FVA], piece_weights[FVA] = Crop_Pieces(pieces[FVA], read_window, window, overlap_mode)
+            piece_owners[FVA], piece_HUC8s[FVA] = [piece_owners[FVA][i] for i in kept], [piece_HUC8s[FVA][i] for i in kept]
+
+        owner_window = None
+        if overlap_mode == "HUC_OWNERSHIP" and any(len(FVA_pieces) > 1 for FVA_pieces in pieces.values()):
+            owner_window = Read_Owner_Window(huc_owner, window, cell_size)
+
+        for FVA in window_FVAs:
+            storage = storages[FVA] if storages != None else None
+            block_path, block_path_10m = None, None
+            if seam_windows != None and len(pieces[FVA]) > 1:
+                seam_windows[FVA][window["id"]] = {}
+                Collect_Seam_Statistics(seam_windows[FVA][window["id"]], pieces[FVA], piece_HUC8s[FVA], window, cell_size)
+            if pieces[FVA] != []:
+                result = Resolve_Window(pieces[FVA], window, overlap_mode, piece_owners[FVA], owner_window, piece_weights[FVA])
+                block_path = Write_Window(result, window, grid, block_folders[FVA], FVA, storage)
+                if aggregation_rule != None:
+                    result_10m, window_10m = Aggregate_Window(result, window, grid, aggregation_rule)
+                    block_path_10m = Write_Window(result_10m, window_10m, grid_10m, block_folders[FVA], FVA + "_10m", storage)
+
+            for block_list, new_block, block_name in [(block_lists[FVA], block_path, FVA), (block_lists_10m[FVA], block_path_10m, FVA + "_10m")]:
+                if new_block is not None:
+                    block_list.append(new_block)
+                elif dirty_windows != None:
+                    #Window no longer has data - remove the block left by the previous run
+                    old_block = os.path.join(block_folders[FVA], "{0}_{1}.tif".format(block_name, window["id"]))
+                    if arcpy.Exists(old_block):
+                        arcpy.management.Delete(old_block)
+
+    #Incremental runs rebuild the output from every stored block, rebuilt or not
+    if dirty_windows != None:
+        for FVA in FVAs_to_process:
+            block_files = sorted(file for file in os.listdir(block_folders[FVA]) if file.endswith(".tif"))
+            block_lists[FVA] = [os.path.join(block_folders[FVA], file) for file in block_files if file.startswith(FVA + "_r")]
+            block_lists_10m[FVA] = [os.path.join(block_folders[FVA], file) for file in block_files if file.startswith(FVA + "_10m_")]
+
+    return block_lists, block_lists_10m
+
+def Fingerprint_File(file_path, previous=None):
+    #Size and modified time are checked first - file content is only hashed again when either has changed
+    stat = os.stat(file_path)
+    fingerprint = {"size": stat.st_size, "mtime": int(stat.st_mtime)}
+    if previous != None and previous.get("size") == fingerprint["size"] and previous.get("mtime") == fingerprint["mtime"]:
+        fingerprint["sha1"] = previous["sha1"]
+        return fingerprint
+
+    hasher = hashlib.sha1()
+    with open(file_path, "rb") as raster_file:
+        for chunk in iter(lambda: raster_file.read(8 * 1024 * 1024), b""):
+            hasher.update(chunk)
+    fingerprint["sha1"] = hasher.hexdigest()
+    return fingerprint
+
+def Hash_County_Boundary(County_Boundary):
+    hasher = hashlib.sha1()
+    with arcpy.da.SearchCursor(County_Boundary, ["SHAPE@WKB"]) as cursor:
+        for row in cursor:
+            hasher.update(bytes(row[0]))
+    return hasher.hexdigest()[:16]
+
+def Get_Output_Footprint(input_raster, Output_Spatial_Reference):
+    #Raster extent in the output spatial reference, for matching against output windows
+    extent = arcpy.Raster(input_raster).extent.projectAs(Output_Spatial_Reference)
+    return {"xmin": extent.XMin, "ymin": extent.YMin, "xmax": extent.XMax, "ymax": extent.YMax}
+
+def Load_Manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, "r") as manifest_file:
+            return json.load(manifest_file)
+    except:
+        arcpy.AddWarning("Could not read {0} - rebuilding all windows".format(os.path.basename(manifest_path)))
+        return None
+
+def Save_Manifest(manifest_path, manifest):
+    #Write to a temp file first so a failed run never leaves a half-written manifest
+    with open(manifest_path + ".tmp", "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=1)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+def Plan_Incremental_Combine(FFRMS_Geodatabase, Output_Raster_Filenames, HUC8_raster_dict, HUC8_erase_area_dict, County_Boundary, grid, window_size,
+                             overlap_mode="MEAN", storages=None, aggregation_rule=None):
+    """
+    Compares current inputs against the manifest saved with each county raster and finds the windows to rebuild.
+
+    The manifest records the output grid, a hash of the county boundary, and for each HUC8 the tool folder raster
+    checksum, the Erase_Areas hash and the raster footprint. A changed grid, overlap mode, storage, 10m aggregation or county boundary rebuilds every window.
+    Otherwise only windows touched by a changed, added or removed HUC8 (old or new footprint) are rebuilt.
+    """
+    arcpy.AddMessage(u"\u200B")
+    arcpy.AddMessage("##### Checking Inputs Against Previous Combine #####")
+
+    cache_folder = os.path.join(os.path.dirname(FFRMS_Geodatabase), "Combine_Cache")
+    grid_key = [grid["xmin"], grid["ymin"], grid["ncols"], grid["nrows"], grid["cell_size"], grid["spatial_reference"].name, window_size, overlap_mode]
+    if overlap_mode == "BLEND":
+        grid_key.append(BLEND_DISTANCE) #BLEND blocks depend on the weight distance - blocks built with another distance are rebuilt
+    county_hash = Hash_County_Boundary(County_Boundary)
+    hash_settings = {"spatial_reference": grid["spatial_reference"].exportToString(), "cell_size": grid["cell_size"]}
+    erase_hashes = {HUC8: Hash_Erase_Features(Erase_Area_Feature, None, hash_settings)
+                    for HUC8, Erase_Area_Feature in HUC8_erase_area_dict.items() if HUC8 in HUC8_raster_dict}
+    windows = Create_Windows(grid, window_size)
+
+    manifests, dirty_windows, block_folders = {}, {}, {}
+    for FVA, Output_Raster_Filename in Output_Raster_Filenames.items():
+        manifest_path = os.path.join(cache_folder, "{0}_manifest.json".format(Output_Raster_Filename))
+        block_folders[FVA] = os.path.join(cache_folder, "Blocks", Output_Raster_Filename)
+        previous = Load_Manifest(manifest_path)
+
+        manifest = {"grid": grid_key, "county": county_hash, "storage": storages[FVA] if storages != None else None,
+                    "aggregate_10m": aggregation_rule, "hucs": {}}
+        for HUC8, FVA_rasters in HUC8_raster_dict.items():
+            if FVA not in FVA_rasters:
+                continue
+            previous_huc = previous["hucs"].get(HUC8, {}) if previous != None else {}
+            manifest["hucs"][HUC8] = {"raster": Fingerprint_File(FVA_rasters[FVA], previous_huc.get("raster")),
+                                      "erase": erase_hashes.get(HUC8),
+                                      "footprint": Get_Output_Footprint(FVA_rasters[FVA], grid["spatial_reference"])}
+        manifests[FVA] = (manifest_path, manifest)
+
+        if (previous == None or previous["grid"] != grid_key or previous["county"] != county_hash or previous.get("storage") != manifest["storage"] or
+                previous.get("aggregate_10m") != aggregation_rule or
+                (aggregation_rule != None and not arcpy.Exists(os.path.join(FFRMS_Geodatabase, Output_Raster_Filename[:-3] + "10m"))) or
+                not arcpy.Exists(os.path.join(FFRMS_Geodatabase, Output_Raster_Filename)) or not os.path.exists(block_folders[FVA])):
+            arcpy.AddMessage("{0}: no matching previous combine - rebuilding all {1} windows".format(FVA, len(windows)))
+            shutil.rmtree(block_folders[FVA], ignore_errors=True)
+            dirty_windows[FVA] = set(window["id"] for window in windows)
+            continue
+
+        changed_footprints, changed_HUC8s = [], []
+        for HUC8 in set(previous["hucs"]) | set(manifest["hucs"]):
+            old, new = previous["hucs"].get(HUC8), manifest["hucs"].get(HUC8)
+            if old != None and new != None and old["raster"]["sha1"] == new["raster"]["sha1"] and old["erase"] == new["erase"]:
+                continue
+            changed_HUC8s.append(HUC8)
+            changed_footprints += [huc["footprint"] for huc in [old, new] if huc != None]
+
+        dirty_windows[FVA] = set(window["id"] for window in windows if any(Window_Overlaps(window, footprint) for footprint in changed_footprints))
+        if changed_HUC8s == []:
+            arcpy.AddMessage("{0}: no input changes".format(FVA))
+        else:
+            arcpy.AddMessage("{0}: HUC8s changed {1} - rebuilding {2} of {3} windows".format(FVA, ", ".join(sorted(changed_HUC8s)), len(dirty_windows[FVA]), len(windows)))
+
+    return manifests, dirty_windows, block_folders
+
+def Write_COG(Output_Raster, cog_folder):
+    """
+    Writes the county raster as a tiled, LZW compressed Cloud Optimized GeoTIFF with internal overviews.
+
+    Overviews are built once, here, using all cores. A signature of the geodatabase raster is saved next to the COG so
+    Export FFRMS Geodatabase can copy the COG as long as the raster has not been edited since (e.g. by Fix FVA Rasters).
+    """
+    arcpy.AddMessage(u"\u200B")
+    arcpy.AddMessage("##### Writing Cloud Optimized GeoTIFF #####")
+
+    if not os.path.exists(cog_folder):
+        os.makedirs(cog_folder)
+    cog_path = os.path.join(cog_folder, os.path.basename(Output_Raster) + ".tif")
+    signature_path = cog_path + ".json"
+    if os.path.exists(signature_path):
+        os.remove(signature_path)
+
+    with arcpy.EnvManager(pyramid="PYRAMIDS -1 NEAREST DEFAULT 75 NO_SKIP", parallelProcessingFactor="100%", compression="LZW", tileSize="512 512"):
+        arcpy.management.CopyRaster(in_raster=Output_Raster, out_rasterdataset=cog_path, nodata_value=NODATA_VALUE,
+                                    pixel_type="32_BIT_FLOAT", format="COG")
+
+    #Signature is written last - a COG without one is never reused
+    with open(signature_path, "w") as signature_file:
+        json.dump({"source": os.path.basename(Output_Raster), "signature": Raster_Signature(Output_Raster)}, signature_file, indent=1)
+    arcpy.AddMessage("Saved {0}".format(cog_path))
+
 def Round_Raster(Output_Mosaic_Dataset, pixel_type_dict):
     arcpy.AddMessage(u"\u200B")
     arcpy.AddMessage("##### Rounding Raster Values #####")
@@ -175,14 +1476,21 @@ def Round_Raster(Output_Mosaic_Dataset, pixel_type_dict):
         ras = Raster(Output_Mosaic_Dataset)
         Output_Mosaic_Dataset_rounded = Float(Int(ras*10.0 + 0.5)/10.0)   
 
+    Check_Output_Pixel_Type(Output_Mosaic_Dataset_rounded, pixel_type_dict)
+
+    return Output_Mosaic_Dataset_rounded
+
+def Check_Output_Pixel_Type(Output_Raster, pixel_type_dict):
     #Check pixel type of output raster - should be 32 bit float
-    pixel_type = arcpy.GetRasterProperties_management(Output_Mosaic_Dataset_rounded, "VALUETYPE").getOutput(0)
+    pixel_type = arcpy.GetRasterProperties_management(Output_Raster, "VALUETYPE").getOutput(0)
     if pixel_type != "9":
         arcpy.AddWarning("Output raster is not 32_BIT_FLOAT.  Please check the output raster for inconsistencies.")
     else:
         arcpy.AddMessage("Output mosaic raster is type " + pixel_type_dict[int(pixel_type)])
 
-    return Output_Mosaic_Dataset_rounded
+def Round_Window(result):
+    #Same rounding as Round_Raster - Float(Int(x*10.0 + 0.5)/10.0), Int truncates toward zero
+    return (np.trunc(result.astype(np.float64) * 10.0 + 0.5) / 10.0).astype(np.float32)
 
 def Clip_to_County(Output_Mosaic_Dataset_rounded, County_Boundary, Output_Raster):
     arcpy.AddMessage(u"\u200B")
@@ -389,64 +1697,156 @@ def Create_AOI_and_Erase_Area_Dictionaries(HUC_Erase_Area_gdbs):
 
     return HUC8_erase_area_dict, HUC8_AOI_dict
 
+def Cascade_Erase_Flags(flags):
+    """
+    Applies the FVA ladder rules to Erase_Areas Y flags for all rows at once.
+
+    flags is a boolean array with one column per ERASE_FIELDS entry. Any ladder FVA flagged 'Y' makes every lower FVA 'Y',
+    and Erase_All_FVAs makes every FVA, including 0_2PCT, 'Y'. Returns the cascaded copy.
+    """
+    cascaded = flags.copy()
+    ladder = flags[:, 1:5]
+    highest = np.where(ladder.any(axis=1), 3 - np.argmax(ladder[:, ::-1], axis=1), -1)
+    cascaded[:, 1:5] |= np.arange(4)[None, :] < highest[:, None]
+    cascaded[flags[:, 0], 1:6] = True
+    return cascaded
+
+def Read_Erase_Flags(HUC8, Erase_Area_Feature):
+    #Reads the Y/N fields of one Erase_Areas table into arrays
+    try:
+        oid_field = arcpy.Describe(Erase_Area_Feature).OIDFieldName
+        table = arcpy.da.TableToNumPyArray(Erase_Area_Feature, [oid_field] + ERASE_FIELDS, null_value={field: "" for field in ERASE_FIELDS})
+        flags = np.column_stack([table[field] == "Y" for field in ERASE_FIELDS]) if len(table) > 0 else np.zeros((0, len(ERASE_FIELDS)), dtype=bool)
+        return {"HUC8": HUC8, "oid_field": oid_field, "oids": table[oid_field], "flags": flags, "error": None}
+    except Exception as e:
+        return {"HUC8": HUC8, "error": str(e)}
+
+def Write_Erase_Flags(Erase_Area_Feature, oid_field, changed_rows):
+    #Only rows whose flags changed are updated - changed_rows is {OBJECTID: cascaded flags}
+    oids = sorted(changed_rows.keys())
+    for chunk_start in range(0, len(oids), 1000):
+        where_clause = "{0} IN ({1})".format(oid_field, ",".join(str(oid) for oid in oids[chunk_start:chunk_start + 1000]))
+        with arcpy.da.UpdateCursor(Erase_Area_Feature, [oid_field] + ERASE_FIELDS, where_clause) as cursor:
+            for row in cursor:
+                cascaded = changed_rows[row[0]]
+                for i in range(len(ERASE_FIELDS)):
+                    if cascaded[i]:
+                        row[i + 1] = "Y"
+                cursor.updateRow(row)
+
 def Check_Erase_Areas(HUC8_erase_area_dict):
+    """
+    Checks and normalizes the Yes/No values of every Erase_Areas table.
+
+    Tables are read one at a time (arcpy is not thread safe) and every row is checked before anything is written, so all rows
+    without a 'Y' value are reported together. The ladder cascade is applied to whole arrays and only rows it changes are written back.
+    """
     arcpy.AddMessage(u"\u200B")
     arcpy.AddMessage("##### Checking Erase Areas Yes/No Values #####")
+    if len(HUC8_erase_area_dict) == 0:
+        return
 
-    for HUC8, Erase_Area_Feature in HUC8_erase_area_dict.items():
-        #Search cursor through fields to find any True values
-        search_fields = ["OBJECTID", "Erase_All_FVAs", "Erase_00FVA", "Erase_01FVA", "Erase_02FVA", "Erase_03FVA", "Erase_0_2PCT"]
-        arcpy.AddMessage("HUC8 {0}".format(HUC8))
+    results = [Read_Erase_Flags(HUC8, Erase_Area_Feature) for HUC8, Erase_Area_Feature in HUC8_erase_area_dict.items()]
 
-        with arcpy.da.UpdateCursor(Erase_Area_Feature, search_fields) as cursor:
-            for row in cursor:
-                if "Y" not in row:
-                    arcpy.AddError("Erase Areas for HUC8 {0} has no 'Y' coded values in row with OBJECTID {1}. Please update Erase Areas to contain at least one Y value per row, and try again".format(HUC8, row[0]))
-                    sys.exit()
-                
-                #Make sure lower FVAs are true if higher FVAs are true - ignoring 0_2PCT
-                if row[1] == "Y":
-                    row[2] = row[3] = row[4] = row[5] = row[6] = "Y"
-                elif row[5] == "Y":
-                    row[2] =row[3] = row[4] = "Y"
-                elif row[4] == "Y":
-                    row[2] = row[3] = "Y"
-                elif row[3] == "Y":
-                    row[2] = "Y"
-                cursor.updateRow(row)
+    #Report every problem before exiting
+    problems = False
+    for result in results:
+        if result["error"] != None:
+            arcpy.AddError("Erase Areas for HUC8 {0} could not be read: {1}".format(result["HUC8"], result["error"]))
+            problems = True
+            continue
+        no_Y = result["oids"][~result["flags"].any(axis=1)]
+        if len(no_Y) > 0:
+            arcpy.AddError("Erase Areas for HUC8 {0} has no 'Y' coded values in rows with OBJECTID {1}".format(result["HUC8"], ", ".join(str(oid) for oid in no_Y)))
+            problems = True
+    if problems:
+        arcpy.AddError("Please update Erase Areas to contain at least one Y value per row, and try again")
+        sys.exit()
 
-        arcpy.AddMessage("Erase Areas are formatted properly")
+    #Make sure lower FVAs are 'Y' if higher FVAs are 'Y' - ignoring 0_2PCT unless Erase_All_FVAs is 'Y'
+    for result in results:
+        cascaded = Cascade_Erase_Flags(result["flags"])
+        changed = (cascaded != result["flags"]).any(axis=1)
+        if changed.any():
+            Write_Erase_Flags(HUC8_erase_area_dict[result["HUC8"]], result["oid_field"],
+                              {int(oid): cascaded[i] for i, oid in zip(np.flatnonzero(changed), result["oids"][changed])})
+        arcpy.AddMessage("HUC8 {0}: {1} rows checked, {2} rows updated".format(result["HUC8"], len(result["oids"]), int(changed.sum())))
+
+    arcpy.AddMessage("Erase Areas are formatted properly")
     return
 
-def find_and_process_rasters_in_folder(folder, raster_name, FVA, HUC8_erase_area_dict, County_Boundary):
+def Create_Mask_Cache(FFRMS_Geodatabase, FIPS_code, grid, snap_raster):
+    #Clip masks are kept next to the county geodatabase so they survive between runs
+    cache_folder = os.path.join(os.path.dirname(FFRMS_Geodatabase), "Combine_Cache", "Clip_Masks")
+    if not os.path.exists(cache_folder):
+        os.makedirs(cache_folder)
+    arcpy.AddMessage("Clip mask cache location: {0}".format(cache_folder))
+
+    return {"cache_folder": cache_folder, "FIPS_code": FIPS_code, "snap_raster": snap_raster,
+            "spatial_reference": grid["spatial_reference"].exportToString(), "cell_size": grid["cell_size"]}
+
+def Hash_Erase_Features(Erase_Area_Feature, query, mask_cache):
+    """
+    Hashes the geometry and attributes of the erase features selected by query, along with the output grid.
+    Edits to features outside the selection (or to other FVA fields) do not change the hash.
+    """
+    hasher = hashlib.sha1()
+    hasher.update(mask_cache["spatial_reference"].encode("utf-8"))
+    hasher.update(str(mask_cache["cell_size"]).encode("utf-8"))
+
+    fields = ["SHAPE@WKB"] + [field.name for field in arcpy.ListFields(Erase_Area_Feature)
+                              if field.type not in ["OID", "Geometry", "GlobalID"] and field.name.upper() not in ["SHAPE_LENGTH", "SHAPE_AREA"]]
+    rows = []
+    with arcpy.da.SearchCursor(Erase_Area_Feature, fields, query) as cursor:
+        for row in cursor:
+            geometry = bytes(row[0]) if row[0] != None else b""
+            rows.append((geometry, repr(row[1:]).encode("utf-8")))
+
+    #Sort so feature order in the table does not matter
+    for geometry, attributes in sorted(rows):
+        hasher.update(geometry)
+        hasher.update(attributes)
+
+    return hasher.hexdigest()[:16]
+
+def Get_Clip_Mask_Cache_Path(mask_cache, HUC8, FVA, Erase_Area_Feature, query):
+    erase_hash = Hash_Erase_Features(Erase_Area_Feature, query, mask_cache)
+    mask_name = "{0}_{1}_{2}_{3}.tif".format(mask_cache["FIPS_code"], HUC8, FVA, erase_hash)
+    return os.path.join(mask_cache["cache_folder"], mask_name)
+
+def Create_Clip_Mask_Raster(Mask_boundary, erase_layer, clip_mask_raster, mask_cache):
+    arcpy.AddMessage("Building clip mask {0}".format(os.path.basename(clip_mask_raster)))
+
+    clip_mask = r"in_memory/clip_mask"
+    try:
+        arcpy.analysis.Erase(in_features=Mask_boundary, erase_features=erase_layer, out_feature_class=clip_mask)
+    except:
+        #if erase doesn't work, use Erase_without_tool function
+        Erase_without_tool(Mask_boundary, erase_layer, clip_mask)
+
+    #Rasterize onto the 3m output grid - written under a partial name first so an interrupted run never leaves a bad cache entry
+    Output_Spatial_Reference = arcpy.SpatialReference()
+    Output_Spatial_Reference.loadFromString(mask_cache["spatial_reference"])
+    partial_raster = clip_mask_raster.replace(".tif", "_partial.tif")
+    with arcpy.EnvManager(outputCoordinateSystem=Output_Spatial_Reference, snapRaster=mask_cache["snap_raster"], cellSize=mask_cache["cell_size"]):
+        arcpy.conversion.PolygonToRaster(in_features=clip_mask, value_field=arcpy.Describe(clip_mask).OIDFieldName,
+                                         out_rasterdataset=partial_raster, cell_assignment="CELL_CENTER", cellsize=mask_cache["cell_size"])
+    arcpy.management.Rename(partial_raster, clip_mask_raster)
+    arcpy.management.Delete(clip_mask)
+
+    return clip_mask_raster
+
+def find_and_process_rasters_in_folder(HUC8_raster_dict, raster_name, FVA, HUC8_erase_area_dict, County_Boundary, mask_cache=None):
             
-    #Find tool output rasters:
+    #Tool output rasters were found by Find_HUC8_Rasters:
     HUC8_raster_list = []
     raster_num = 0
-    for tool_folder in Tool_Output_Folders:
-        tool_folder = tool_folder.replace("'","") #Fixes One-Drive folder naming 
-
-        #Check for extra subfolder level - can be caused by unzipping to folder with same name
-        for folder in os.listdir(tool_folder):
-            if os.path.basename(folder) == os.path.basename(tool_folder):
-                tool_folder = os.path.join(tool_folder, os.path.basename(folder))
-
-        #Get HUC8 from folder name
-        HUC8 = os.path.basename(tool_folder)[:8]
+    for HUC8, FVA_rasters in HUC8_raster_dict.items():
         arcpy.AddMessage("## Processing HUC8 {0} ##".format(HUC8))
-        
-        #look for raster based on FVA
-        raster_path = None
-        for file in os.listdir(tool_folder):
-            if raster_name in file: 
-                if file.endswith(".tif") or file.endswith(".tiff"):
-                    raster_path = os.path.join(tool_folder, file)
-                    arcpy.AddMessage("Found {0} raster in {1}".format(raster_name, os.path.basename(tool_folder)))
-                    break
-
-        if raster_path == None:
-            arcpy.AddMessage("No {0} raster found in {1}".format(raster_name, os.path.basename(tool_folder)))
+        if FVA not in FVA_rasters:
             continue
+        raster_path = FVA_rasters[FVA]
+        arcpy.AddMessage("Found {0} raster in {1}".format(raster_name, os.path.basename(os.path.dirname(raster_path))))
 
         #Erase Raster based on Erase_Area
         try:
@@ -470,6 +1870,13 @@ def find_and_process_rasters_in_folder(folder, raster_name, FVA, HUC8_erase_area
         if erase == False:
             #Dont add erase areas
             clip_mask = Mask_boundary
+        elif mask_cache != None:
+            #Reuse rasterized clip mask if erase areas have not changed since it was built
+            clip_mask = Get_Clip_Mask_Cache_Path(mask_cache, HUC8, FVA, Erase_Area_Feature, query)
+            if arcpy.Exists(clip_mask):
+                arcpy.AddMessage("Using cached clip mask {0}".format(os.path.basename(clip_mask)))
+            else:
+                Create_Clip_Mask_Raster(Mask_boundary, "Erase_Area_subset", clip_mask, mask_cache)
         else:
             #add erase areas to clip mask
             clip_mask = r"in_memory/clip_mask"
@@ -492,13 +1899,102 @@ def find_and_process_rasters_in_folder(folder, raster_name, FVA, HUC8_erase_area
             arcpy.AddError("Extracting HUC8 {0} Raster failed. Please ensure that FVA{1} output grids exist for this HUC8. If not, remove this HUC from processing".format(HUC8, FVA))
         
         #save temp raster
-        temp_raster_path = os.path.join(FFRMS_Geodatabase, "Temp_HUC8_Raster_{0}".format(raster_num))
+        temp_raster_path = os.path.join(FFRMS_Geodatabase, "Temp_HUC8_Raster_{0}_{1}".format(raster_num, HUC8))
         arcpy.management.CopyRaster(outExtractByMask, temp_raster_path)
         raster_num += 1
 
         HUC8_raster_list.append(temp_raster_path)
     return HUC8_raster_list
 
+def Extract_HUC8_Raster(job):
+    #Runs in a worker process - each worker has its own arcpy session, so inputs must be on disk, not in_memory
+    try:
+        arcpy.env.overwriteOutput = True
+        arcpy.env.compression = "LZW"
+        arcpy.CheckOutExtension("Spatial")
+        if job["snap_raster"] != None:
+            Output_Spatial_Reference = arcpy.SpatialReference()
+            Output_Spatial_Reference.loadFromString(job["spatial_reference"])
+            arcpy.env.outputCoordinateSystem = Output_Spatial_Reference
+            arcpy.env.cellSize = job["cell_size"]
+            arcpy.env.snapRaster = job["snap_raster"]
+
+        clip_mask = job["county_boundary"]
+        if job["erase_feature"] != None:
+            arcpy.management.MakeFeatureLayer(job["erase_feature"], "Erase_Area_subset", job["erase_query"])
+        if job["clip_mask_raster"] != None:
+            clip_mask = job["clip_mask_raster"]
+            if not arcpy.Exists(clip_mask):
+                Create_Clip_Mask_Raster(job["county_boundary"], "Erase_Area_subset", clip_mask, job["mask_cache"])
+        elif job["erase_feature"] != None:
+            clip_mask = r"in_memory/clip_mask"
+            try:
+                arcpy.analysis.Erase(in_features=job["county_boundary"], erase_features="Erase_Area_subset", out_feature_class=clip_mask)
+            except:
+                Erase_without_tool(job["county_boundary"], "Erase_Area_subset", clip_mask)
+
+        try:
+            outExtractByMask = ExtractByMask(job["raster_path"], clip_mask, "INSIDE")
+        except:
+            outExtractByMask = ExtractByMask(job["raster_path"], clip_mask)
+        outExtractByMask.save(job["output_tile"])
+        return job["HUC8"], job["output_tile"], None
+    except Exception as e:
+        return job["HUC8"], None, str(e)
+
+def Parallel_Extract_HUC8_Rasters(HUC8_raster_dict, FVA, HUC8_erase_area_dict, County_Boundary, worker_count, scratch_folder, grid=None, mask_cache=None):
+    arcpy.AddMessage("Extracting HUC8 rasters using {0} worker processes".format(worker_count))
+
+    #Workers cannot see this process's in_memory workspace - save county boundary to scratch once
+    county_boundary_file = os.path.join(scratch_folder, "county_boundary.shp")
+    if not arcpy.Exists(county_boundary_file):
+        arcpy.management.CopyFeatures(County_Boundary, county_boundary_file)
+
+    tile_folder = os.path.join(scratch_folder, "tiles")
+    if not os.path.exists(tile_folder):
+        os.makedirs(tile_folder)
+
+    jobs = []
+    for HUC8, FVA_rasters in HUC8_raster_dict.items():
+        if FVA not in FVA_rasters:
+            continue
+        job = {"HUC8": HUC8, "raster_path": FVA_rasters[FVA], "county_boundary": county_boundary_file,
+               "erase_feature": HUC8_erase_area_dict.get(HUC8),
+               "erase_query": "Erase_{0} = 'Y' OR Erase_All_FVAs = 'Y'".format(FVA),
+               "output_tile": os.path.join(tile_folder, "{0}_{1}.tif".format(HUC8, FVA)),
+               "snap_raster": None, "clip_mask_raster": None, "mask_cache": mask_cache}
+        if job["erase_feature"] != None and mask_cache != None:
+            job["clip_mask_raster"] = Get_Clip_Mask_Cache_Path(mask_cache, HUC8, FVA, job["erase_feature"], job["erase_query"])
+            if arcpy.Exists(job["clip_mask_raster"]):
+                arcpy.AddMessage("Using cached clip mask {0}".format(os.path.basename(job["clip_mask_raster"])))
+        if grid != None:
+            job["snap_raster"] = arcpy.env.snapRaster
+            job["spatial_reference"] = grid["spatial_reference"].exportToString()
+            job["cell_size"] = grid["cell_size"]
+        jobs.append(job)
+
+    if jobs == []:
+        return []
+
+    #ArcGIS Pro on Windows runs scripts inside ArcGISPro.exe - workers must be started with python.exe instead
+    if os.name == "nt":
+        multiprocessing.set_executable(os.path.join(sys.exec_prefix, "python.exe"))
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(worker_count, len(jobs))) as executor:
+        results = list(executor.map(Extract_HUC8_Raster, jobs))
+
+    #Keep tool folder order so the mosaic step sees the same input order as the serial extraction
+    HUC8_raster_list = []
+    for HUC8, output_tile, error in results:
+        if error != None:
+            arcpy.AddError("Extracting HUC8 {0} Raster failed. Please ensure that FVA{1} output grids exist for this HUC8. If not, remove this HUC from processing".format(HUC8, FVA))
+            arcpy.AddError(error)
+            sys.exit()
+        arcpy.AddMessage("Extracted HUC8 {0} {1} raster".format(HUC8, FVA))
+        HUC8_raster_list.append(output_tile)
+
+    return HUC8_raster_list
+
 def Determine_FVAs_To_Process(FVAs):
     FVAs_to_process = []
     All_FVAs = ["00FVA", "01FVA", "02FVA", "03FVA", "0_2PCT"]
@@ -520,6 +2016,101 @@ def Determine_FVAs_To_Process(FVAs):
     arcpy.AddMessage("##### Tool will process the following FVAs: {0} #####".format(FVAs_to_process))
     return FVAs_to_process, raster_dict
 
+def Get_Optional_Parameter(index, default):
+    #Parameters added after the original tool inputs are optional - use default when not provided
+    try:
+        value = arcpy.GetParameterAsText(index)
+    except:
+        value = ""
+    if value == "" or value == None:
+        return default
+    return value
+
+def Select_AOIs_In_County_Extent(HUC8_AOI_dict, County_Boundary):
+    #Bounding box prefilter - skip HUC8 AOI feature classes outside the county extent, and select only features touching it
+    AOI_layers = {}
+    county_extent = arcpy.Describe(County_Boundary).extent
+    for HUC, AOI_Feature in HUC8_AOI_dict.items():
+        AOI_spatial_reference = arcpy.Describe(AOI_Feature).spatialReference
+        county_box = county_extent.projectAs(AOI_spatial_reference) if AOI_spatial_reference.name != county_extent.spatialReference.name else county_extent
+        if arcpy.Describe(AOI_Feature).extent.disjoint(county_box.polygon):
+            arcpy.AddMessage("HUC8 {0} AOIs are outside the county extent - skipping".format(HUC))
+            continue
+
+        AOI_layer = "AOI_Layer_{0}".format(HUC)
+        arcpy.management.MakeFeatureLayer(AOI_Feature, AOI_layer)
+        arcpy.management.SelectLayerByLocation(AOI_layer, "INTERSECT", county_box.polygon)
+        selected = int(arcpy.management.GetCount(AOI_layer)[0])
+        arcpy.AddMessage("HUC8 {0}: {1} AOIs within county extent".format(HUC, selected))
+        if selected > 0:
+            AOI_layers[HUC] = AOI_layer
+        else:
+            arcpy.management.Delete(AOI_layer)
+    return AOI_layers
+
+def Insert_Features(source_features, target_features, workspace):
+    #Bulk insert matching fields (by name, like Append NO_TEST) in one edit operation - all rows are written or none are
+    skip_types = ["OID", "Geometry", "GlobalID"]
+    target_fields = [field.name for field in arcpy.ListFields(target_features) if field.type not in skip_types and field.editable]
+    source_fields = [field.name for field in arcpy.ListFields(source_features)]
+    fields = [field for field in target_fields if field in source_fields and field.upper() not in ["SHAPE_LENGTH", "SHAPE_AREA"]]
+
+    row_count = 0
+    with arcpy.da.Editor(workspace):
+        with arcpy.da.SearchCursor(source_features, ["SHAPE@"] + fields) as search_cursor, \
+             arcpy.da.InsertCursor(target_features, ["SHAPE@"] + fields) as insert_cursor:
+            for row in search_cursor:
+                insert_cursor.insertRow(row)
+                row_count += 1
+    return row_count
+
+def Append_AOIs(HUC8_AOI_dict, County_Boundary, AOI_Target, FFRMS_Geodatabase):
+    """
+    Clips every HUC8 AOI to the county and adds them to S_AOI_Ar in one batch.
+
+    AOIs are prefiltered by the county bounding box, merged, clipped in a single overlay and inserted in a single edit
+    operation. If the batch clip fails, each HUC8 is clipped on its own and any that still fail are added unclipped.
+    """
+    AOI_layers = Select_AOIs_In_County_Extent(HUC8_AOI_dict, County_Boundary)
+    if AOI_layers == {}:
+        arcpy.AddMessage("No AOIs within county extent")
+        return
+
+    Merged_AOI = r"in_memory\Merged_AOI"
+    Clipped_AOI = r"in_memory\Clipped_AOI"
+    arcpy.AddMessage("Clipping AOIs from {0} HUC8s to county boundary".format(len(AOI_layers)))
+    try:
+        arcpy.management.Merge(list(AOI_layers.values()), Merged_AOI)
+        arcpy.analysis.Clip(Merged_AOI, County_Boundary, Clipped_AOI)
+        AOI_batches = [Clipped_AOI]
+    except:
+        arcpy.AddWarning("Failed to clip AOIs in one batch - clipping each HUC8 separately")
+        AOI_batches = []
+        for HUC, AOI_layer in AOI_layers.items():
+            HUC_Clipped_AOI = r"in_memory\Clipped_AOI_{0}".format(HUC)
+            try:
+                arcpy.analysis.Clip(AOI_layer, County_Boundary, HUC_Clipped_AOI)
+                AOI_batches.append(HUC_Clipped_AOI)
+            except:
+                arcpy.AddWarning(f"Failed to clip AOIs in HUC {HUC} - please manually clip to county boundary")
+                AOI_batches.append(AOI_layer)
+
+    #Make sure geodatabase has S_AOI_Ar feature class
+    if not arcpy.Exists(AOI_Target):
+        arcpy.AddWarning("No S_AOI_Ar found in county geodatabase. Creating feature from clipped HUC8 AOIs")
+        arcpy.management.CopyFeatures(AOI_batches[0], AOI_Target)
+        AOI_batches = AOI_batches[1:]
+
+    row_count = 0
+    for AOI_batch in AOI_batches:
+        row_count += Insert_Features(AOI_batch, AOI_Target, FFRMS_Geodatabase)
+    arcpy.AddMessage("Added {0} AOIs to S_AOI_Ar".format(row_count))
+
+    HUC_Clipped_AOIs = [r"in_memory\Clipped_AOI_{0}".format(HUC) for HUC in AOI_layers]
+    for temp_feature in [Merged_AOI, Clipped_AOI] + HUC_Clipped_AOIs + list(AOI_layers.values()):
+        if arcpy.Exists(temp_feature):
+            arcpy.management.Delete(temp_feature)
+
 def get_name_parts(FFRMS_Geodatabase):
     Geodatabase_name_parts = FFRMS_Geodatabase.split("_")
     riv_or_cst = Geodatabase_name_parts[-1][:3]
@@ -536,11 +2127,58 @@ if __name__ == '__main__':
     FVAs = arcpy.GetParameterAsText(3).split(";")
     Append_AOI_Areas = arcpy.GetParameterAsText(4)
     Tool_Template_Folder = arcpy.GetParameterAsText(5)
+    Combine_Mode = Get_Optional_Parameter(6, "Standard") #Standard, Windowed or Single_Pass
+    Window_Size = int(Get_Optional_Parameter(7, "2048")) #Window width/height in cells for Windowed mode
+    Worker_Count = int(Get_Optional_Parameter(8, "1")) #Number of HUC8 rasters to extract at once
+    Clip_Mask_Cache = Get_Optional_Parameter(9, "No") #Yes - reuse rasterized clip masks from earlier runs
+    Incremental = Get_Optional_Parameter(10, "No") #Yes - Single_Pass mode only rebuilds windows touched by changed HUC8 inputs
+    Plan_Only = Get_Optional_Parameter(11, "No") #Yes - check raster headers and report the plan without combining
+    Overlap_Mode = Get_Optional_Parameter(12, "BLEND" if Combine_Mode == "Standard" else "MEAN") #How overlapping HUC8 rasters are resolved
+    Benchmark_Overlap = Get_Optional_Parameter(13, "No") #Yes - Windowed mode compares every overlap mode with Mosaic BLEND
+    COG_Output = Get_Optional_Parameter(14, "No") #Yes - also write each county raster as a Cloud Optimized GeoTIFF with overviews
+    Storage_Mode = Get_Optional_Parameter(15, "Float32") #Scaled_Int - window blocks hold integer tenths of a foot (Windowed and Single_Pass only)
+    Output_10m = Get_Optional_Parameter(16, "No") #Yes - also build the 10m product from the 3m windows (Windowed and Single_Pass only)
+    Aggregation_Rule = Get_Optional_Parameter(17, "MEAN") #How 3m cells are combined into a 10m cell
+    Seam_Statistics = Get_Optional_Parameter(18, "Yes") #Yes - record WSEL differences where HUC8 rasters overlap (Windowed and Single_Pass only)
+
+    #Check overlap mode
+    if Overlap_Mode not in OVERLAP_MODES:
+        arcpy.AddError("Overlap Mode must be one of {0}".format(", ".join(OVERLAP_MODES)))
+        sys.exit()
+    if Overlap_Mode == "HUC_OWNERSHIP" and Combine_Mode == "Standard":
+        arcpy.AddError("HUC_OWNERSHIP overlap mode requires Combine Mode 'Windowed' or 'Single_Pass'")
+        sys.exit()
+    if Benchmark_Overlap == "Yes" and Combine_Mode != "Windowed":
+        arcpy.AddWarning("Overlap benchmark is only run in Combine Mode 'Windowed' - skipping benchmark")
+    if Storage_Mode == "Scaled_Int" and Combine_Mode == "Standard":
+        arcpy.AddWarning("Scaled_Int storage is only used in Combine Mode 'Windowed' or 'Single_Pass' - using Float32")
+        Storage_Mode = "Float32"
+    if Output_10m == "Yes" and Combine_Mode == "Standard":
+        arcpy.AddWarning("10m product is only built in Combine Mode 'Windowed' or 'Single_Pass' - skipping 10m product")
+        Output_10m = "No"
+    if Incremental == "Yes" and Combine_Mode != "Single_Pass":
+        arcpy.AddWarning("Incremental runs are only used in Combine Mode 'Single_Pass' - rebuilding the whole county")
+        Incremental = "No"
+    if Output_10m == "Yes" and Aggregation_Rule not in AGGREGATION_RULES:
+        arcpy.AddError("Aggregation Rule must be one of {0}".format(", ".join(AGGREGATION_RULES)))
+        sys.exit()
+    if Output_10m == "Yes" and Window_Size % 10 != 0:
+        #Windows must hold a whole number of 10m cells (30m) - round up to the next multiple of 10 cells
+        Window_Size = int(math.ceil(Window_Size / 10.0)) * 10
+        arcpy.AddMessage("Window size set to {0} cells so windows line up with 10m cells".format(Window_Size))
+    aggregation_rule = Aggregation_Rule if Output_10m == "Yes" else None
     
     #Environment settings
     arcpy.env.workspace = FFRMS_Geodatabase
     arcpy.env.overwriteOutput = True
     arcpy.env.compression = "LZW"
+
+    #COG output - overviews are built once in the COG, so the geodatabase raster is written without pyramids
+    Output_Pyramids = "PYRAMIDS -1 NEAREST DEFAULT 75 NO_SKIP NO_SIPS"
+    COG_Folder = os.path.join(os.path.dirname(FFRMS_Geodatabase), "COG")
+    if COG_Output == "Yes":
+        Output_Pyramids = "NONE"
+        arcpy.env.pyramid = "NONE"
     
     #Fix One-Drive Naming convention:
     HUC_Erase_Area_gdbs_fixed = []
@@ -590,6 +2228,74 @@ if __name__ == '__main__':
     
     #Determine which FVAs to process    
     FVAs_to_process, raster_dict = Determine_FVAs_To_Process(FVAs)
+
+    #Local scratch folder for extracted HUC8 tiles and window blocks
+    scratch_folder = tempfile.mkdtemp(prefix="FFRMS_Combine_")
+    grid, mask_cache = None, None
+    output_grid = Create_Output_Grid(County_Boundary, Output_Spatial_Reference)
+
+    #Find rasters in every tool folder and, for the windowed modes or a plan only run, check their headers before any pixels are read.
+    #Standard mode is left to the Mosaic tool as before, so the plan cannot stop a run that would have completed
+    #Tool folder index is kept with the combine cache so later runs skip folder listings and footprint reads
+    cache_folder = os.path.join(os.path.dirname(FFRMS_Geodatabase), "Combine_Cache")
+    if not os.path.exists(cache_folder):
+        os.makedirs(cache_folder)
+    HUC8_raster_dict = Find_HUC8_Rasters(Tool_Output_Folders, FVAs_to_process, raster_dict, os.path.join(cache_folder, "Tool_Folder_Index.json"), output_grid)
+    if Combine_Mode in ["Windowed", "Single_Pass"] or Plan_Only == "Yes":
+        Plan_Combine(HUC8_raster_dict, output_grid, Combine_Mode, Window_Size, FVAs_to_process)
+    if Plan_Only == "Yes":
+        shutil.rmtree(scratch_folder, ignore_errors=True)
+        arcpy.AddMessage(u"\u200B")
+        arcpy.AddMessage("##### Plan Only - No Rasters Combined #####")
+        sys.exit()
+
+    if Combine_Mode in ["Windowed", "Single_Pass"] or Clip_Mask_Cache == "Yes":
+        snap_raster = Create_Snap_Raster(output_grid, scratch_folder)
+
+    #Clip masks are rasterized on the 3m output grid and cached by FIPS, HUC8, FVA and erase area content
+    if Clip_Mask_Cache == "Yes":
+        mask_cache = Create_Mask_Cache(FFRMS_Geodatabase, FIPS_code, output_grid, snap_raster)
+
+    #Windowed mode - extract HUC8 rasters directly onto the 3m output grid so windows can be read by cell offset
+    if Combine_Mode in ["Windowed", "Single_Pass"]:
+        grid = output_grid
+        arcpy.env.outputCoordinateSystem = Output_Spatial_Reference
+        arcpy.env.cellSize = grid["cell_size"]
+        arcpy.env.snapRaster = snap_raster
+
+    #HUC ownership - rasterize HUC8 boundaries once, shared by all FVAs
+    huc_owner = None
+    if Overlap_Mode == "HUC_OWNERSHIP" or (Benchmark_Overlap == "Yes" and Combine_Mode == "Windowed" and arcpy.Exists(HUC8_shapefile)):
+        huc_owner = Create_HUC8_Owner_Raster(HUC8_shapefile, County_Boundary, list(HUC8_raster_dict.keys()), grid, scratch_folder)
+
+    #Single pass mode - read each HUC8 folder and erase area once, then build every FVA from one traversal of the grid
+    dirty_windows = None
+    if Combine_Mode == "Single_Pass":
+        #Scaled integer storage - one scale/offset per FVA, from the statistics of every HUC8 raster for that FVA
+        storages = None
+        if Storage_Mode == "Scaled_Int":
+            storages = {FVA: Get_Scaled_Storage([FVA_rasters[FVA] for FVA_rasters in HUC8_raster_dict.values() if FVA in FVA_rasters])
+                        for FVA in FVAs_to_process}
+
+        #Incremental - compare inputs to the manifest saved with each county raster and only rebuild changed windows
+        block_folders = None
+        if Incremental == "Yes":
+            Output_Raster_Filenames = {FVA: "{0}_{1}_{2}_{3}_{4}_{5}m".format(state_abrv, FIPS_code, UTM_zone, FVA, riv_or_cst, "03") for FVA in FVAs_to_process}
+            manifests, dirty_windows, block_folders = Plan_Incremental_Combine(FFRMS_Geodatabase, Output_Raster_Filenames, HUC8_raster_dict,
+                                                                               HUC8_erase_area_dict, County_Boundary, grid, Window_Size, Overlap_Mode, storages,
+                                                                               aggregation_rule)
+
+        #Seam statistics by window - incremental runs start from the statistics saved with the block store
+        seam_windows = None
+        if Seam_Statistics == "Yes":
+            seam_windows = {FVA: {} for FVA in FVAs_to_process}
+            if block_folders != None:
+                for FVA in FVAs_to_process:
+                    seam_windows[FVA] = Load_Manifest(os.path.join(block_folders[FVA], "{0}_seams.json".format(FVA))) or {}
+
+        FVA_block_lists, FVA_block_lists_10m = Single_Pass_Combine(HUC8_raster_dict, HUC8_erase_area_dict, FVAs_to_process, County_Boundary,
+                                                                   grid, Window_Size, scratch_folder, mask_cache, block_folders, dirty_windows,
+                                                                   Overlap_Mode, huc_owner, storages, aggregation_rule, seam_windows)
     
     #loop through FVAs, create raster name, and process
     for FVA in FVAs_to_process:
@@ -599,33 +2305,93 @@ if __name__ == '__main__':
         #Set Output Mosaiced Raster path
         Output_Raster_Filename = "{0}_{1}_{2}_{3}_{4}_{5}m".format(state_abrv, FIPS_code, UTM_zone, FVA, riv_or_cst, "03")
         Output_Raster = os.path.join(FFRMS_Geodatabase, Output_Raster_Filename)
+        Output_Raster_Filename_10m = "{0}_{1}_{2}_{3}_{4}_{5}m".format(state_abrv, FIPS_code, UTM_zone, FVA, riv_or_cst, "10")
         
+        #Incremental - nothing changed behind this raster, keep it as is
+        if dirty_windows != None and len(dirty_windows[FVA]) == 0:
+            arcpy.AddMessage("No input changes for {0} - keeping existing {1}".format(FVA, Output_Raster_Filename))
+            Save_Manifest(*manifests[FVA])
+            continue
+
         #Check for existence of HANDy Rasters
         handy_raster_name = raster_dict[FVA]
-        Input_rasters = find_and_process_rasters_in_folder(Tool_Output_Folders, handy_raster_name, FVA, HUC8_erase_area_dict, County_Boundary)
+        if Combine_Mode == "Single_Pass":
+            Input_rasters = FVA_block_lists[FVA] #Blocks are already masked, erased and mosaiced
+        elif Worker_Count > 1:
+            Input_rasters = Parallel_Extract_HUC8_Rasters(HUC8_raster_dict, FVA, HUC8_erase_area_dict, County_Boundary,
+                                                          Worker_Count, scratch_folder, grid, mask_cache)
+        else:
+            Input_rasters = find_and_process_rasters_in_folder(HUC8_raster_dict, handy_raster_name, FVA, HUC8_erase_area_dict, County_Boundary, mask_cache)
         if Input_rasters == []:
             arcpy.AddMessage("No {0} rasters found in any of the tool output folders. Moving on to next raster".format(FVA))
             continue
         
-        #Create Empty Raster
-        Empty_Raster_Dataset = Create_Empty_Raster(FFRMS_Geodatabase, Output_Spatial_Reference, Output_Raster_Filename)
+        if Combine_Mode in ["Windowed", "Single_Pass"]:
+            #Window blocks are resolved, rounded and masked as they are written - mosaic them straight into the output raster
+            if Combine_Mode == "Single_Pass":
+                storage = storages[FVA] if storages != None else None
+                Mosaic_Output_Blocks(FFRMS_Geodatabase, Output_Spatial_Reference, Output_Raster_Filename, Input_rasters, storage, Output_Pyramids)
+                block_list_10m = FVA_block_lists_10m[FVA]
+                FVA_seam_windows = seam_windows[FVA] if seam_windows != None else None
+                if FVA_seam_windows != None and block_folders != None:
+                    Save_Manifest(os.path.join(block_folders[FVA], "{0}_seams.json".format(FVA)), FVA_seam_windows)
+            else:
+                FVA_seam_windows = {} if Seam_Statistics == "Yes" else None
+                storage = Get_Scaled_Storage(Input_rasters) if Storage_Mode == "Scaled_Int" else None
+                if storage != None:
+                    #Scaled integer blocks are mosaiced as integers and converted to the float32 output raster in one step
+                    Output_Dataset = Output_Raster
+                else:
+                    Output_Dataset = Create_Empty_Raster(FFRMS_Geodatabase, Output_Spatial_Reference, Output_Raster_Filename, Output_Raster_Filename, Output_Pyramids)
+                Output_Dataset, block_list_10m = Windowed_Mosaic_Raster(Output_Dataset, Input_rasters, grid, Window_Size, scratch_folder,
+                                                                        Overlap_Mode, huc_owner, storage, aggregation_rule, FVA_seam_windows)
+            Check_Output_Pixel_Type(Output_Raster, pixel_type_dict)
+
+            if FVA_seam_windows != None:
+                Save_Seam_Statistics(FVA_seam_windows, FVA, FFRMS_Geodatabase, Output_Raster_Filename)
+
+            #10m product - blocks were aggregated from the 3m windows as they were written
+            if aggregation_rule != None:
+                arcpy.AddMessage("Building 10m product ({0} of 3m cells)".format(aggregation_rule))
+                Mosaic_Output_Blocks(FFRMS_Geodatabase, Output_Spatial_Reference, Output_Raster_Filename_10m, block_list_10m, storage, Output_Pyramids, 10)
+                Check_Output_Pixel_Type(os.path.join(FFRMS_Geodatabase, Output_Raster_Filename_10m), pixel_type_dict)
+
+            if Benchmark_Overlap == "Yes" and Combine_Mode == "Windowed":
+                Benchmark_Overlap_Modes(Input_rasters, grid, Window_Size, FFRMS_Geodatabase, Output_Spatial_Reference, Output_Raster_Filename, huc_owner)
 
-        #Mosaic Rasters
-        Output_Mosaic_Dataset = Mosaic_Raster(Empty_Raster_Dataset, Input_rasters)
-        
-        #Round Raster to 10th of a foot
-        Output_Mosaic_Dataset_rounded = Round_Raster(Output_Mosaic_Dataset, pixel_type_dict)
+        else:
+            #Create Empty Raster
+            Empty_Raster_Dataset = Create_Empty_Raster(FFRMS_Geodatabase, Output_Spatial_Reference, Output_Raster_Filename, pyramids=Output_Pyramids)
 
-        #Save raster to Output Raster name
-        arcpy.AddMessage("Saving Raster")
-        arcpy.management.CopyRaster(Output_Mosaic_Dataset_rounded, Output_Raster)
+            #Mosaic Rasters
+            Output_Mosaic_Dataset = Mosaic_Raster(Empty_Raster_Dataset, Input_rasters, Overlap_Mode)
+            
+            #Round Raster to 10th of a foot
+            Output_Mosaic_Dataset_rounded = Round_Raster(Output_Mosaic_Dataset, pixel_type_dict)
+
+            #Save raster to Output Raster name
+            arcpy.AddMessage("Saving Raster")
+            arcpy.management.CopyRaster(Output_Mosaic_Dataset_rounded, Output_Raster)
+            arcpy.management.Delete(Empty_Raster_Dataset)
+
+        if COG_Output == "Yes":
+            Write_COG(Output_Raster, COG_Folder)
+            if aggregation_rule != None:
+                Write_COG(os.path.join(FFRMS_Geodatabase, Output_Raster_Filename_10m), COG_Folder)
+
+        #Incremental - blocks stay in the block store for the next run, record the inputs behind this raster
+        if dirty_windows != None:
+            Save_Manifest(*manifests[FVA])
+            continue
 
         #Delete Temp Files
         arcpy.AddMessage("Deleting Temporary HUC8 Rasters")
         for file in Input_rasters:
             arcpy.management.Delete(file)
-        arcpy.management.Delete(Empty_Raster_Dataset)
+        if Combine_Mode == "Windowed":
+            shutil.rmtree(os.path.join(scratch_folder, "blocks"), ignore_errors=True)
         
+    shutil.rmtree(scratch_folder, ignore_errors=True)
         
     arcpy.AddMessage(u"\u200B")
     arcpy.AddMessage("##### All FVA Rasters Processed #####")
@@ -641,27 +2407,7 @@ if __name__ == '__main__':
         if len(HUC8_AOI_dict) == 0:
             arcpy.AddMessage("No AOIs to append")
         else:
-            #Make sure geodtabase has S_AOI_Target feature class
-            if not arcpy.Exists(AOI_Target):
-                arcpy.AddWarning("No S_AOI_Ar found in county geodatabase. Creating feature from first HUC8 AOI provided")
-                #copy first AOI to AOI_Target
-                first_AOI = list(HUC8_AOI_dict.values())[0]
-                arcpy.management.CopyFeatures(first_AOI, AOI_Target)
-                loop_start = 1
-            else:
-                loop_start = 0
-
-            for HUC, AOI_Feature in list(HUC8_AOI_dict.items())[loop_start:]:
-                arcpy.AddMessage("Clipping and Appending HUC8 {0} AOIs".format(HUC))
-                
-                # Clipping AOI to County Boundary
-                Clipped_AOI = "in_memory\\Clipped_AOI"  # Temporary in-memory storage for clipped AOI
-                try:
-                    arcpy.analysis.Clip(AOI_Feature, County_Boundary, Clipped_AOI)
-                    arcpy.management.Append(Clipped_AOI, AOI_Target, "NO_TEST")
-                except:
-                    arcpy.AddWarning(f"Failed to clip AOIs in HUC {HUC} - please manually clip to county boundary")
-                    arcpy.management.Append(AOI_Feature, AOI_Target, "NO_TEST")
+            Append_AOIs(HUC8_AOI_dict, County_Boundary, AOI_Target, FFRMS_Geodatabase)
 
         arcpy.AddMessage(u"\u200B")
         arcpy.AddMessage("##### All AOIs Appended #####")
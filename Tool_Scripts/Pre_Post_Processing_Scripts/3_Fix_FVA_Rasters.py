@@ -7,12 +7,27 @@ import os
 from arcpy import env
 from arcpy.sa import *
 import shutil
+import json
+import hashlib
 import pandas as pd
 from arcpy import management as mgmt
 from arcpy import AddMessage as msg
 from arcpy import AddWarning as warn
 from os import path as pth
 
+#Block engine settings
+NODATA_VALUE = -99999
+BLOCK_SIZE = 2048 #Cells per block side - memory use depends on block size, not county size
+MEDIAN_WINDOW = 10 #Default median neighborhood - matches the 10x10 FocalStatistics neighborhood used by fix_raster_using_median_values
+MEDIAN_CHUNK_SIZE = 65536 #Violating cells evaluated at once by median_fill
+FVA_LADDER = ["00FVA", "01FVA", "02FVA", "03FVA"]
+DIFFERENCE_BINS = [-np.inf, -3, -2, -1, 0, 1, 2, 3, np.inf] #Histogram edges (feet) for higher minus lower FVA differences
+PATCH_FIELDS = [("rows", np.int32), ("cols", np.int32), ("old", np.float32), ("new", np.float32), ("rule", np.uint8)] #Arrays kept for each changed cell
+RULE_BITS = {"extent": 1, "ladder": 2, "median": 4, "0_2PCT": 8} #Rule that changed a cell, recorded in patch files
+
+#FVA constraints - Tool_Scripts/FVA_Constraints.json is the only copy, also read by the raster QC and County QC tools
+FVA_CONSTRAINTS_PATH = pth.join(pth.dirname(pth.dirname(pth.abspath(__file__))), "FVA_Constraints.json")
+
 def setup_workspace():
 
     """
@@ -47,6 +62,82 @@ def title_text(string):
     msg(u'\u200B')
     msg(f'+-----{string}-----+') 
     
+def get_optional_parameter(index, default):
+    """
+    The get_optional_parameter function reads a tool parameter added after the original FFRMS geodatabase input.
+
+    :param index: The tool parameter index
+    :param default: Value used when the parameter is empty, or the toolbox does not define it
+    :return: The parameter value as text
+    """
+
+    try:
+        value = arcpy.GetParameterAsText(index)
+    except:
+        value = ""
+    if value == "" or value == None:
+        return default
+    return value
+
+def compile_fva_constraints(constraints_path):
+    """
+    The compile_fva_constraints function reads the fix constraints and turns them into arrays,
+    so every constraint pair can be checked against a block in one pass.
+
+    :param constraints_path: Path to FVA_Constraints.json
+    :return: Dictionary of the constraint pairs, their step bounds (tolerance applied), NoData handling and fix steps
+    :process:
+        1. Stops the tool if the file is missing or has no "fix" constraints
+        2. Checks every FVA ladder pair and 00FVA to 0_2PCT has a constraint, and there are no other pairs -
+           enforce_fva_ladder only fixes those pairs, so any other pair would be flagged but never fixed
+        3. Checks the step a fix creates (fix_step of higher minus fix_step of lower) is within each pair's bounds,
+           otherwise every fixed cell would still fail
+    """
+
+    title_text("Loading FVA Constraints")
+
+    if not pth.exists(constraints_path):
+        arcpy.AddError(f"Could not find FVA constraints file {constraints_path} - it is shared with the QC tools and must sit in Tool_Scripts")
+        exit()
+
+    try:
+        with open(constraints_path) as f:
+            constraints = json.load(f)["fix"]
+    except (ValueError, KeyError) as e:
+        arcpy.AddError(f"Could not read fix constraints from {constraints_path}: {e}")
+        exit()
+
+    pairs = [(c["lower"], c["higher"]) for c in constraints]
+    enforced = list(zip(FVA_LADDER[:-1], FVA_LADDER[1:])) + [("00FVA", "0_2PCT")]
+    missing = [pair for pair in enforced if pair not in pairs]
+    if missing:
+        arcpy.AddError(f"{constraints_path} has no fix constraint for {', '.join(' to '.join(pair) for pair in missing)}")
+        exit()
+    extra = [pair for pair in pairs if pair not in enforced]
+    if extra:
+        arcpy.AddError(f"{constraints_path} has fix constraints the fix tool cannot enforce: {', '.join(' to '.join(pair) for pair in extra)} - "
+                       f"only {', '.join(' to '.join(pair) for pair in enforced)} can be fixed")
+        exit()
+
+    no_limit = lambda value, default: default if value is None else value
+    min_step = np.array([no_limit(c["min_step"], -np.inf) - c["tolerance"] for c in constraints])
+    max_step = np.array([no_limit(c["max_step"], np.inf) + c["tolerance"] for c in constraints])
+    fix_steps = {"00FVA": 0.0, **{c["higher"]: c["fix_step"] for c in constraints}}
+
+    #Fixed cells are set to FVA00 + fix_step, so the step between a fixed pair is the difference of their fix steps
+    for i, (lower_FVA, higher_FVA) in enumerate(pairs):
+        fixed_step = fix_steps[higher_FVA] - fix_steps[lower_FVA]
+        if not min_step[i] <= fixed_step <= max_step[i]:
+            arcpy.AddError(f"{constraints_path}: fix steps give {higher_FVA} minus {lower_FVA} = {fixed_step} ft, outside the allowed {min_step[i]} to {max_step[i]} ft")
+            exit()
+
+    msg(f"Loaded {len(pairs)} fix constraints from {constraints_path}")
+    return {"pairs": pairs,
+            "min_step": min_step,
+            "max_step": max_step,
+            "fill_nodata": np.array([c["nodata"] == "fill" for c in constraints]),
+            "fix_step": fix_steps}
+
 def check_out_spatial_analyst():
     """
     The check_out_spatial_analyst function checks out the spatial analyst extension.
@@ -491,6 +582,68 @@ def create_difference_raster(FVA_higher_raster_path, FVA_lower_raster_path):
 
     return min_diff_val, min_raster
 
+def reduce_fva_difference(FVA_higher_raster_path, FVA_lower_raster_path, early_exit=False, block_size=BLOCK_SIZE):
+    """
+    The reduce_fva_difference function streams both rasters block by block and summarizes higher minus lower FVA differences
+    without building a difference raster.
+
+    :param FVA_higher_raster_path: The higher FVA raster
+    :param FVA_lower_raster_path: The lower FVA raster
+    :param early_exit: If True, stop at the first block with a negative difference - the summary only covers blocks read so far
+
+    :return: Dictionary with the minimum difference (None if the rasters do not overlap), count of negative cells,
+             histogram counts over DIFFERENCE_BINS, and the bounding box of the negative cells in each violating block
+    """
+
+    grid = create_block_grid([FVA_higher_raster_path, FVA_lower_raster_path])
+    summary = {"cell_size": grid["cell_size"], "minimum": None, "negative_count": 0, "histogram": np.zeros(len(DIFFERENCE_BINS) - 1, dtype=np.int64),
+               "violating_blocks": []}
+    for block in create_blocks(grid, block_size):
+        higher, _ = read_block(FVA_higher_raster_path, grid, block)
+        lower, _ = read_block(FVA_lower_raster_path, grid, block)
+        difference = (higher - lower)[~np.isnan(higher) & ~np.isnan(lower)]
+        if difference.size == 0:
+            continue
+
+        block_minimum = float(difference.min())
+        summary["minimum"] = block_minimum if summary["minimum"] is None else min(summary["minimum"], block_minimum)
+        summary["histogram"] += np.histogram(difference, DIFFERENCE_BINS)[0]
+        if block_minimum >= 0:
+            continue
+
+        with np.errstate(invalid="ignore"):
+            rows, cols = np.nonzero(higher - lower < 0)
+        summary["negative_count"] += len(rows)
+        summary["violating_blocks"].append({
+            "id": block["id"], "count": int(len(rows)),
+            "xmin": float(grid["xmin"] + (block["col_off"] + cols.min()) * grid["cell_size"]),
+            "xmax": float(grid["xmin"] + (block["col_off"] + cols.max() + 1) * grid["cell_size"]),
+            "ymin": float(grid["ymax"] - (block["row_off"] + rows.max() + 1) * grid["cell_size"]),
+            "ymax": float(grid["ymax"] - (block["row_off"] + rows.min()) * grid["cell_size"])})
+        if early_exit:
+            break
+
+    return summary
+
+def violation_extent(summary, buffer_cells=MEDIAN_WINDOW):
+    #One bounding box around every violating block in a reduce_fva_difference summary, buffered by buffer_cells.
+    #Violations far apart still give an extent close to the whole county - only the Block engine works tile by tile
+    buffer = buffer_cells * summary["cell_size"]
+    blocks = summary["violating_blocks"]
+    return arcpy.Extent(min(block["xmin"] for block in blocks) - buffer, min(block["ymin"] for block in blocks) - buffer,
+                        max(block["xmax"] for block in blocks) + buffer, max(block["ymax"] for block in blocks) + buffer)
+
+def report_fva_difference(summary, lower_FVA, higher_FVA):
+    #Messages for a reduce_fva_difference summary
+    msg(f"Smallest difference between rasters is {summary['minimum']}")
+    labels = [f"{lower} to {upper}" for lower, upper in zip(DIFFERENCE_BINS[:-1], DIFFERENCE_BINS[1:])]
+    msg("Difference histogram ({0} minus {1}): {2}".format(higher_FVA, lower_FVA,
+        ", ".join(f"{label}: {count}" for label, count in zip(labels, summary["histogram"]) if count > 0)))
+    if summary["negative_count"] > 0:
+        msg(f"{summary['negative_count']} cells in {len(summary['violating_blocks'])} blocks have {higher_FVA} below {lower_FVA}")
+        for block in summary["violating_blocks"]:
+            msg("Block {0}: {1} cells within ({2}, {3}) - ({4}, {5})".format(block["id"], block["count"], block["xmin"], block["ymin"], block["xmax"], block["ymax"]))
+
 def set_difference_raster_to_lower_FVA_values(min, FVA_lower_raster_path):
     
     lower_FVA_raster = arcpy.Raster(FVA_lower_raster_path)
@@ -572,7 +725,59 @@ def fix_raster_using_median_values(target_raster_path, min_raster, temp_gdb, sav
                 except:
                     warn(f"Failed to save {output} to temp gdb")
             
-def calc_fva_diff2(raster_list, temp_gdb):
+def fix_raster_using_sparse_median(target_raster_path, min_raster, temp_dir, window=MEDIAN_WINDOW):
+    """
+    The fix_raster_using_sparse_median function fixes the same cells as fix_raster_using_median_values, but only
+    computes the median at those cells instead of running FocalStatistics over the whole raster.
+
+    :param target_raster_path: The raster to fix
+    :param min_raster: The difference raster - cells with values of 0 or less are replaced
+    :param temp_dir: The location where the patch tile will be saved
+    :param window: Width and height of the median neighborhood in cells
+
+    :process:
+    1.  Read the difference raster, and the target raster over the same cells
+    2.  Replace the cells with the rounded median of their neighborhood, leaving out the replaced cells and NoData (median_fill)
+    3.  Mosaic the replaced cells into the target raster
+    """
+
+    FVA_Val = os.path.basename(target_raster_path).split('_')[3]
+    min_raster = arcpy.Raster(min_raster)
+    cell_size = min_raster.meanCellWidth
+    msg(f"Finding median values for {FVA_Val} raster at bad cells only")
+
+    #Read the target one neighborhood beyond the difference raster, so cells on its edge see all their neighbors
+    halo = window // 2
+    lower_left = arcpy.Point(min_raster.extent.XMin - halo * cell_size, min_raster.extent.YMin - halo * cell_size)
+    differences = arcpy.RasterToNumPyArray(min_raster, nodata_to_value=np.nan).astype(np.float32)
+    target = arcpy.RasterToNumPyArray(target_raster_path, lower_left, min_raster.width + 2 * halo, min_raster.height + 2 * halo,
+                                      nodata_to_value=np.nan).astype(np.float32)
+
+    cells = np.zeros(target.shape, dtype=bool)
+    with np.errstate(invalid="ignore"):
+        cells[halo:halo + min_raster.height, halo:halo + min_raster.width] = differences <= 0
+    if not cells.any():
+        return
+
+    filled = median_fill(target, cells, window)
+    changed = cells & ~np.isnan(filled) & ((filled != target) | np.isnan(target))
+    if not changed.any():
+        return
+
+    grid = {"xmin": lower_left.X, "ymax": lower_left.Y + target.shape[0] * cell_size, "cell_size": cell_size,
+            "spatial_reference": min_raster.spatialReference}
+    tile_path = pth.join(temp_dir, f"median_{FVA_Val}.tif")
+    msg("Mosaicing fixed cells into raster")
+    mosaic_patch_tiles([write_patch_tile(filled, changed, grid, {"row_off": 0, "col_off": 0}, tile_path)], target_raster_path)
+
+def fix_raster_using_median(target_raster_path, min_raster, temp_gdb, temp_dir, median_window=MEDIAN_WINDOW, median_repair="Sparse"):
+    #Median repair mode from the tool parameters - "Sparse" computes medians at bad cells only, "Focal" uses FocalStatistics
+    if median_repair == "Focal":
+        fix_raster_using_median_values(target_raster_path, min_raster, temp_gdb, save=False)
+    else:
+        fix_raster_using_sparse_median(target_raster_path, min_raster, temp_dir, median_window)
+
+def calc_fva_diff2(raster_list, temp_gdb, temp_dir=None, median_window=MEDIAN_WINDOW, median_repair="Focal"):
     title_text("Fixing cell values")
 
     failed = False
@@ -588,51 +793,56 @@ def calc_fva_diff2(raster_list, temp_gdb):
         msg(f"Higher Raster: {pth.basename(FVA_higher_raster_path)}")
         msg(f"Lower Raster: {pth.basename(FVA_lower_raster_path)}")
 
-        #Determine if there are any negative differences, and provide difference raster
-        min_diff_val, min = create_difference_raster(FVA_higher_raster_path, FVA_lower_raster_path)
-        if min_diff_val >= 0:
+        #Determine if there are any negative differences, and which blocks they are in
+        summary = reduce_fva_difference(FVA_higher_raster_path, FVA_lower_raster_path)
+        if summary["negative_count"] == 0:
             msg('No difference values less than 0 found - no changes will be made to {} raster'.format(higher_FVA))
             msg('Moving on to next FVA comparison')
             continue
         msg(f'Cell Value Descrepancies found between {lower_FVA} and {higher_FVA} - Fixing...')
-        
-        #Set starting point to always fix FVA01 Raster first
-        con = set_difference_raster_to_lower_FVA_values(min, FVA0_raster_path) #Set diff to FVA00 values
-
-        #Fix all FVA rasters below the current higher FVA
-        if i == 1: #FVA01 is highest raster
-            title_text("Fixing FVA01 Raster")
-            update_cells_and_mosaic(con, raster_list[i], 1) #Update FVA01
-
-        elif i == 2: #FVA02 is highest raster
-            title_text("Fixing FVA01 and FVA02 Raster")
-            update_cells_and_mosaic(con, raster_list[i-1], 1)   #Update FVA01 first
-            update_cells_and_mosaic(con, raster_list[i], 2)   #Update FVA02 first
-
-            msg("Looking for persisting differences between FVA02 and FVA01 Rasters")
-            min_diff_val_fixed1, min_fixed1 = create_difference_raster(raster_list[i], raster_list[i-1]) #compare FVA02 and FVA01
-            if min_diff_val_fixed1 <= 0: #if there are any negative values - fix them
-                msg("Found persistent cell difference issues - fixing using median values of surrounding cells")
-                fix_raster_using_median_values(raster_list[i-1], min_fixed1, temp_gdb, save=False)
-                fix_raster_using_median_values(raster_list[i], min_fixed1, temp_gdb, save=False)
-
-        elif i == 3: #FVA03 is highest raster
-            title_text("Fixing FVA01, FVA02, and FVA03 Rasters")
-            update_cells_and_mosaic(con, raster_list[i-2], 1)   #Update FVA01
-            update_cells_and_mosaic(con, raster_list[i-1], 2)   #Update FVA02
-            update_cells_and_mosaic(con, raster_list[i], 3)     #Update FVA03
-
-            msg("Looking for persisting differences between FVA03 and FVA02 Rasters")
-            min_diff_val_fixed_2, min_fixed2 = create_difference_raster(raster_list[i], raster_list[i-1]) #compare FVA02 and FVA01
-            if min_diff_val_fixed_2 <= 0: #if there are any negative values - fix them
-                msg("Found persistent cell difference issues - fixing using median values of surrounding cells")
-                fix_raster_using_median_values(raster_list[i-2], min_fixed2, temp_gdb, save=False)
-                fix_raster_using_median_values(raster_list[i-1], min_fixed2, temp_gdb, save=False)
-                fix_raster_using_median_values(raster_list[i], min_fixed2, temp_gdb, save=False)
+
+        #Tools only run inside the bounding box of the blocks with violations - buffered so the median neighborhood is complete
+        with arcpy.EnvManager(extent=violation_extent(summary, median_window)):
+            min_diff_val, min = create_difference_raster(FVA_higher_raster_path, FVA_lower_raster_path)
+
+            #Set starting point to always fix FVA01 Raster first
+            con = set_difference_raster_to_lower_FVA_values(min, FVA0_raster_path) #Set diff to FVA00 values
+
+            #Fix all FVA rasters below the current higher FVA
+            if i == 1: #FVA01 is highest raster
+                title_text("Fixing FVA01 Raster")
+                update_cells_and_mosaic(con, raster_list[i], FREEBOARD_STEPS["01FVA"]) #Update FVA01
+
+            elif i == 2: #FVA02 is highest raster
+                title_text("Fixing FVA01 and FVA02 Raster")
+                update_cells_and_mosaic(con, raster_list[i-1], FREEBOARD_STEPS["01FVA"])   #Update FVA01 first
+                update_cells_and_mosaic(con, raster_list[i], FREEBOARD_STEPS["02FVA"])   #Update FVA02 first
+
+                msg("Looking for persisting differences between FVA02 and FVA01 Rasters")
+                min_diff_val_fixed1, min_fixed1 = create_difference_raster(raster_list[i], raster_list[i-1]) #compare FVA02 and FVA01
+                if min_diff_val_fixed1 <= 0: #if there are any negative values - fix them
+                    msg("Found persistent cell difference issues - fixing using median values of surrounding cells")
+                    fix_raster_using_median(raster_list[i-1], min_fixed1, temp_gdb, temp_dir, median_window, median_repair)
+                    fix_raster_using_median(raster_list[i], min_fixed1, temp_gdb, temp_dir, median_window, median_repair)
+
+            elif i == 3: #FVA03 is highest raster
+                title_text("Fixing FVA01, FVA02, and FVA03 Rasters")
+                update_cells_and_mosaic(con, raster_list[i-2], FREEBOARD_STEPS["01FVA"])   #Update FVA01
+                update_cells_and_mosaic(con, raster_list[i-1], FREEBOARD_STEPS["02FVA"])   #Update FVA02
+                update_cells_and_mosaic(con, raster_list[i], FREEBOARD_STEPS["03FVA"])     #Update FVA03
+
+                msg("Looking for persisting differences between FVA03 and FVA02 Rasters")
+                min_diff_val_fixed_2, min_fixed2 = create_difference_raster(raster_list[i], raster_list[i-1]) #compare FVA02 and FVA01
+                if min_diff_val_fixed_2 <= 0: #if there are any negative values - fix them
+                    msg("Found persistent cell difference issues - fixing using median values of surrounding cells")
+                    fix_raster_using_median(raster_list[i-2], min_fixed2, temp_gdb, temp_dir, median_window, median_repair)
+                    fix_raster_using_median(raster_list[i-1], min_fixed2, temp_gdb, temp_dir, median_window, median_repair)
+                    fix_raster_using_median(raster_list[i], min_fixed2, temp_gdb, temp_dir, median_window, median_repair)
 
         #Check to see if this actually fixed the problem!
-        min_diff_val_fixed_final, min_fixed_final = create_difference_raster(FVA_higher_raster_path, FVA_lower_raster_path)
-        if min_diff_val_fixed_final >= 0:
+        summary = reduce_fva_difference(FVA_higher_raster_path, FVA_lower_raster_path)
+        report_fva_difference(summary, lower_FVA, higher_FVA)
+        if summary["negative_count"] == 0:
             msg('No difference values less than 0 found - {0} Raster has been fixed!'.format(higher_FVA))
             msg('Moving on to next FVA comparison')
         else:
@@ -642,7 +852,7 @@ def calc_fva_diff2(raster_list, temp_gdb):
             msg(f'Difference raster path: {output_path}')
             failed = True
             try:
-                arcpy.CopyRaster_management(min_fixed_final, output_path)
+                arcpy.CopyRaster_management(arcpy.sa.Minus(FVA_higher_raster_path, FVA_lower_raster_path), output_path)
             except:
                 msg("Could not copy raster to temp gdb")
             msg('Moving on to next FVA comparison')
@@ -801,22 +1011,27 @@ def Fix_02_pct_Raster(raster_02pct_path, raster_list, temp_gdb, process_02pct):
 
         title_text(f"Calculating FVA Difference between {lower_FVA} and {higher_FVA} rasters")
 
-        #Determine if there are any negative differences, and provide difference raster
-        min_diff_val, min = create_difference_raster(raster_02pct_path, FVA0_raster_path)
-        if min_diff_val >= 0:
+        #Determine if there are any negative differences, and which blocks they are in
+        summary = reduce_fva_difference(raster_02pct_path, FVA0_raster_path)
+        if summary["negative_count"] == 0:
             msg('No difference values less than 0 found - no changes will be made to {} raster'.format(higher_FVA))
             return failed2
         msg(f'Cell Value Descrepancies found between {lower_FVA} and {higher_FVA} - Fixing...')
-    
-        #Set cells equal to FVA0
-        con = set_difference_raster_to_lower_FVA_values(min, FVA0_raster_path) #Set diff to FVA00 values
 
-        #Fix all FVA rasters below the current higher FVA
-        update_cells_and_mosaic(con, raster_02pct_path, 0) #Add 0 to 00FVA raster to get 02PCT raster
+        #Tools only run inside the bounding box of the blocks with violations
+        with arcpy.EnvManager(extent=violation_extent(summary, 0)):
+            min_diff_val, min = create_difference_raster(raster_02pct_path, FVA0_raster_path)
+        
+            #Set cells equal to FVA0
+            con = set_difference_raster_to_lower_FVA_values(min, FVA0_raster_path) #Set diff to FVA00 values
+
+            #Fix all FVA rasters below the current higher FVA
+            update_cells_and_mosaic(con, raster_02pct_path, FREEBOARD_STEPS["0_2PCT"]) #Add the 0.2% step to 00FVA raster to get 02PCT raster
 
         #Check to see if this actually fixed the problem!
-        min_diff_val_fixed_final, min_fixed_final = create_difference_raster(raster_02pct_path, FVA0_raster_path)
-        if min_diff_val_fixed_final >= 0:
+        summary = reduce_fva_difference(raster_02pct_path, FVA0_raster_path)
+        report_fva_difference(summary, lower_FVA, higher_FVA)
+        if summary["negative_count"] == 0:
             msg('No difference values less than 0 found - {0} Raster has been fixed!'.format(higher_FVA))
         else:
             warn('Differences still exist - Raster has not been completely fixed. Please check difference raster for inconsistencies')
@@ -824,6 +1039,7 @@ def Fix_02_pct_Raster(raster_02pct_path, raster_list, temp_gdb, process_02pct):
             output_path = pth.join(temp_gdb, output_name)
             msg(f'Difference raster path: {output_path}')
             failed2 = True
+            min_fixed_final = arcpy.sa.Minus(raster_02pct_path, FVA0_raster_path)
             try:
                 arcpy.CopyRaster_management(arcpy.Raster(min_fixed_final), output_path)
             except:
@@ -835,6 +1051,612 @@ def Fix_02_pct_Raster(raster_02pct_path, raster_list, temp_gdb, process_02pct):
 
         return failed2
     
+def create_block_grid(raster_paths):
+    """
+    The create_block_grid function builds the grid shared by every FVA raster in the block engine.
+
+    :param raster_paths: The FVA raster paths - the first raster sets cell size, alignment and spatial reference
+
+    :return: Dictionary of the grid - lower left corner, rows, columns, cell size and spatial reference
+    """
+
+    base_raster = arcpy.Raster(raster_paths[0])
+    cell_size = base_raster.meanCellWidth
+    extents = [arcpy.Raster(raster_path).extent for raster_path in raster_paths]
+
+    #Union of all extents, snapped to the first raster's cells
+    x0, y0 = base_raster.extent.XMin, base_raster.extent.YMin
+    xmin = x0 + np.floor((min(extent.XMin for extent in extents) - x0) / cell_size) * cell_size
+    ymin = y0 + np.floor((min(extent.YMin for extent in extents) - y0) / cell_size) * cell_size
+    xmax = x0 + np.ceil((max(extent.XMax for extent in extents) - x0) / cell_size) * cell_size
+    ymax = y0 + np.ceil((max(extent.YMax for extent in extents) - y0) / cell_size) * cell_size
+
+    return {"xmin": xmin, "ymin": ymin, "ymax": ymax, "cell_size": cell_size,
+            "ncols": int(round((xmax - xmin) / cell_size)), "nrows": int(round((ymax - ymin) / cell_size)),
+            "spatial_reference": base_raster.spatialReference}
+
+def create_blocks(grid, block_size=BLOCK_SIZE):
+    """Splits the grid into blocks of block_size x block_size cells."""
+    blocks = []
+    for row_off in range(0, grid["nrows"], block_size):
+        for col_off in range(0, grid["ncols"], block_size):
+            blocks.append({"id": f"r{row_off // block_size}_c{col_off // block_size}", "row_off": row_off, "col_off": col_off,
+                           "nrows": min(block_size, grid["nrows"] - row_off), "ncols": min(block_size, grid["ncols"] - col_off)})
+    return blocks
+
+def read_block(raster_path, grid, block, halo=0):
+    """
+    The read_block function reads one block of a raster, plus a halo of surrounding cells, as a float array.
+
+    :param raster_path: The raster to read
+    :param grid: The block engine grid
+    :param block: The block to read
+    :param halo: Number of extra cells to read around the block - clipped to the grid
+
+    :return: The block array (NoData and cells outside the raster are nan) and the row/column offset of the block inside it
+    """
+
+    row_start, col_start = max(block["row_off"] - halo, 0), max(block["col_off"] - halo, 0)
+    row_end = min(block["row_off"] + block["nrows"] + halo, grid["nrows"])
+    col_end = min(block["col_off"] + block["ncols"] + halo, grid["ncols"])
+    lower_left = arcpy.Point(grid["xmin"] + col_start * grid["cell_size"], grid["ymax"] - row_end * grid["cell_size"])
+    data = arcpy.RasterToNumPyArray(raster_path, lower_left, col_end - col_start, row_end - row_start, nodata_to_value=np.nan)
+    return data.astype(np.float32), (block["row_off"] - row_start, block["col_off"] - col_start)
+
+def median_fill(values, cells, window=MEDIAN_WINDOW):
+    """
+    The median_fill function replaces cells with the rounded median of their neighborhood, evaluated only at those cells.
+
+    :param values: The array to fix - NoData is nan
+    :param cells: Boolean array of the cells to replace
+    :param window: Width and height of the neighborhood in cells - even windows reach one cell further down and right, like FocalStatistics
+
+    :return: Copy of values with the cells replaced. Replaced cells and NoData are left out of every neighborhood,
+             and cells with no valid neighbors are left as they are
+    """
+
+    before = (window - 1) // 2
+    padding = ((before, window - 1 - before), (before, window - 1 - before))
+    excluded = np.pad(np.where(cells, np.nan, values).astype(np.float32), padding, constant_values=np.nan)
+    neighborhoods = np.lib.stride_tricks.sliding_window_view(excluded, (window, window))
+
+    filled = values.copy()
+    rows, cols = np.nonzero(cells)
+    for start in range(0, len(rows), MEDIAN_CHUNK_SIZE):
+        chunk_rows, chunk_cols = rows[start:start + MEDIAN_CHUNK_SIZE], cols[start:start + MEDIAN_CHUNK_SIZE]
+        stack = neighborhoods[chunk_rows, chunk_cols].reshape(len(chunk_rows), -1)
+        valid = ~np.isnan(stack).all(axis=1)
+        medians = np.nanmedian(stack[valid], axis=1)
+        filled[chunk_rows[valid], chunk_cols[valid]] = np.trunc(medians * 10.0 + 0.5) / 10.0
+    return filled
+
+def enforce_fva_ladder(data, process_02pct, region=np.s_[:, :], median_window=MEDIAN_WINDOW):
+    """
+    The enforce_fva_ladder function enforces the whole FVA ladder on one block in a single vectorized sweep.
+
+    :param data: Dictionary of block arrays - keys are FVA values, NoData is nan
+    :param process_02pct: True if the 0.2% raster is in data under "0_2PCT"
+    :param region: The part of the arrays counted in the rule counts - the block without its halo
+    :param median_window: Width and height of the median neighborhood in cells
+
+    :return: Dictionary of fixed block arrays, dictionary of cell counts per rule, and dictionary of uint8 arrays of the RULE_BITS applied to each cell
+
+    :process:
+    1.  For each FVA pair from 00/01 to 02/03, where the higher FVA is NoData and the lower FVA has a value, fill the higher FVA with the lower FVA plus the freeboard step between them
+    2.  For each FVA pair, where the higher FVA is below the lower FVA, set every FVA up to the higher FVA to FVA00 plus its freeboard step
+    3.  Where differences persist (FVA00 is NoData), replace the cells with the median of surrounding cells in every FVA up to the higher FVA
+    4.  Where the 0.2% raster is NoData and FVA00 has a value, fill it with FVA00 plus its freeboard step if its constraint is set to fill NoData
+    5.  Where the 0.2% raster is below FVA00, set it to FVA00
+    """
+
+    fixed = {FVA: values.copy() for FVA, values in data.items()}
+    rules = {FVA: np.zeros(values.shape, dtype=np.uint8) for FVA, values in data.items()}
+    FVA00 = fixed["00FVA"]
+    counts = {}
+    with np.errstate(invalid="ignore"):
+        #Extent gaps are filled on the NoData masks directly - lower FVA cells carry up the ladder in order
+        for i in range(1, len(FVA_LADDER)):
+            lower, higher = fixed[FVA_LADDER[i-1]], fixed[FVA_LADDER[i]]
+            gap = np.isnan(higher) & ~np.isnan(lower) & constraint_bounds(FVA_LADDER[i-1], FVA_LADDER[i])[2]
+            step = FREEBOARD_STEPS[FVA_LADDER[i]] - FREEBOARD_STEPS[FVA_LADDER[i-1]]
+            higher[gap] = np.trunc((lower[gap] + step) * 10.0 + 0.5) / 10.0
+            rules[FVA_LADDER[i]][gap] |= RULE_BITS["extent"]
+            counts[f"extent_{FVA_LADDER[i]}"] = int(gap[region].sum())
+
+        for i in range(1, len(FVA_LADDER)):
+            violation = breaks_constraint(fixed, FVA_LADDER[i-1], FVA_LADDER[i])
+            fixable = violation & ~np.isnan(FVA00)
+            for FVA in FVA_LADDER[1:i+1]:
+                fixed[FVA][fixable] = FVA00[fixable] + FREEBOARD_STEPS[FVA]
+                rules[FVA][fixable] |= RULE_BITS["ladder"]
+            counts[f"ladder_{FVA_LADDER[i]}"] = int(fixable[region].sum())
+
+        for i in range(2, len(FVA_LADDER)):
+            persisting = breaks_constraint(fixed, FVA_LADDER[i-1], FVA_LADDER[i])
+            if persisting.any():
+                for FVA in FVA_LADDER[1:i+1]:
+                    fixed[FVA] = median_fill(fixed[FVA], persisting, median_window)
+                    rules[FVA][persisting] |= RULE_BITS["median"]
+            counts[f"median_{FVA_LADDER[i]}"] = int(persisting[region].sum())
+
+        if process_02pct:
+            gap = np.isnan(fixed["0_2PCT"]) & ~np.isnan(FVA00) & constraint_bounds("00FVA", "0_2PCT")[2]
+            fixed["0_2PCT"][gap] = np.trunc((FVA00[gap] + FREEBOARD_STEPS["0_2PCT"]) * 10.0 + 0.5) / 10.0
+            rules["0_2PCT"][gap] |= RULE_BITS["extent"]
+            counts["extent_0_2PCT"] = int(gap[region].sum())
+
+            violation = breaks_constraint(fixed, "00FVA", "0_2PCT")
+            fixed["0_2PCT"][violation] = FVA00[violation] + FREEBOARD_STEPS["0_2PCT"]
+            rules["0_2PCT"][violation] |= RULE_BITS["0_2PCT"]
+            counts["ladder_0_2PCT"] = int(violation[region].sum())
+
+    return fixed, counts, rules
+
+def constraint_bounds(lower_FVA, higher_FVA):
+    #Step bounds and NoData fill flag of one constraint pair
+    i = FIX_CONSTRAINTS["pairs"].index((lower_FVA, higher_FVA))
+    return FIX_CONSTRAINTS["min_step"][i], FIX_CONSTRAINTS["max_step"][i], FIX_CONSTRAINTS["fill_nodata"][i]
+
+def breaks_constraint(data, lower_FVA, higher_FVA):
+    #Cells where higher minus lower is outside the step bounds - NoData cells never break the step bounds
+    min_step, max_step, _ = constraint_bounds(lower_FVA, higher_FVA)
+    step = data[higher_FVA] - data[lower_FVA]
+    return (step < min_step) | (step > max_step)
+
+def check_fva_constraints(data, process_02pct):
+    """
+    The check_fva_constraints function evaluates every fix constraint against a block in one vectorized pass.
+
+    :param data: Dictionary of FVA name to block array (NoData as nan)
+    :param process_02pct: True if the 0.2% raster is in data under "0_2PCT"
+    :return: List of the checked (lower FVA, higher FVA) pairs and a (pair, rows, cols) boolean array of violations
+    """
+
+    levels = FVA_LADDER + ["0_2PCT"] if process_02pct else FVA_LADDER
+    keep = [i for i, pair in enumerate(FIX_CONSTRAINTS["pairs"]) if pair[0] in levels and pair[1] in levels]
+    pairs = [FIX_CONSTRAINTS["pairs"][i] for i in keep]
+
+    lower = np.stack([data[pair[0]] for pair in pairs])
+    higher = np.stack([data[pair[1]] for pair in pairs])
+    min_step = FIX_CONSTRAINTS["min_step"][keep][:, None, None]
+    max_step = FIX_CONSTRAINTS["max_step"][keep][:, None, None]
+    fill_nodata = FIX_CONSTRAINTS["fill_nodata"][keep][:, None, None]
+    with np.errstate(invalid="ignore"):
+        step = higher - lower
+        violations = (step < min_step) | (step > max_step)
+        violations |= fill_nodata & np.isnan(higher) & ~np.isnan(lower)
+    return pairs, violations
+
+def find_fva_violations(data, process_02pct):
+    #Cells breaking any constraint fixed by enforce_fva_ladder - extent gaps, ladder violations and 0.2% below FVA00
+    return check_fva_constraints(data, process_02pct)[1].any(axis=0)
+
+def build_violation_tile_index(raster_paths, grid, blocks, process_02pct, index_path):
+    """
+    The build_violation_tile_index function finds the blocks that need fixing, so corrections and writes only touch those blocks.
+
+    :param raster_paths: Dictionary of raster paths - keys are FVA values
+    :param grid: The block engine grid
+    :param blocks: Every block of the grid
+    :param process_02pct: True if the 0.2% raster is in raster_paths under "0_2PCT"
+    :param index_path: JSON file the tile index is saved to
+
+    :return: List of blocks with violations, each with the count of violating cells
+    """
+
+    tile_index = []
+    for block in blocks:
+        data = {FVA: read_block(raster_path, grid, block)[0] for FVA, raster_path in raster_paths.items()}
+        count = int(find_fva_violations(data, process_02pct).sum())
+        if count > 0:
+            tile_index.append(dict(block, count=count))
+
+    with open(index_path, "w") as index_file:
+        json.dump(tile_index, index_file, indent=1)
+
+    violation_count = sum(tile["count"] for tile in tile_index)
+    msg(f"{len(tile_index)} of {len(blocks)} blocks have violations ({violation_count} cells) - tile index saved to {pth.basename(index_path)}")
+    return tile_index
+
+def count_ladder_violations(fixed, process_02pct):
+    #Cells still breaking a step constraint after the sweep - keys are (lower FVA, higher FVA)
+    pairs = check_fva_constraints(fixed, process_02pct)[0]
+    with np.errstate(invalid="ignore"):
+        return {pair: int(breaks_constraint(fixed, *pair).sum()) for pair in pairs}
+
+def write_patch_tile(values, changed, grid, block, tile_path, nodata_value=NODATA_VALUE, dtype=np.float32):
+    """
+    The write_patch_tile function saves the changed cells of one block as a small raster, cropped to the changed cells.
+    Unchanged cells are NoData, so mosaicing the tile into the target raster only replaces the changed cells.
+    """
+
+    rows, cols = np.nonzero(changed)
+    row_start, row_end, col_start, col_end = rows.min(), rows.max() + 1, cols.min(), cols.max() + 1
+    tile = np.where(changed, values, nodata_value)[row_start:row_end, col_start:col_end].astype(dtype)
+
+    lower_left = arcpy.Point(grid["xmin"] + (block["col_off"] + col_start) * grid["cell_size"],
+                             grid["ymax"] - (block["row_off"] + row_end) * grid["cell_size"])
+    arcpy.NumPyArrayToRaster(tile, lower_left, grid["cell_size"], grid["cell_size"], nodata_value).save(tile_path)
+    mgmt.DefineProjection(tile_path, grid["spatial_reference"])
+    return tile_path
+
+def mosaic_patch_tiles(tile_paths, target_raster_path):
+    #One mosaic per raster - every patch tile is written into the target in the same call
+    msg(f"Mosaicing {len(tile_paths)} patch tiles into {pth.basename(target_raster_path)}")
+    mgmt.Mosaic(
+        inputs=";".join(tile_paths),
+        target=target_raster_path,
+        mosaic_type="LAST",
+        colormap="FIRST",
+        background_value=NODATA_VALUE,
+        nodata_value=NODATA_VALUE,
+        onebit_to_eightbit="NONE",
+        mosaicking_tolerance=0,
+        MatchingMethod="NONE"
+    )
+
+def fix_fva_rasters_by_block(raster_list, raster_02pct_path, process_02pct, temp_dir, patch_path, block_size=BLOCK_SIZE, median_window=MEDIAN_WINDOW):
+    """
+    The fix_fva_rasters_by_block function finds the FVA extent and cell value fixes for all rasters in one sweep over the
+    county grid, and saves them to a patch file. No raster is changed - the patch is applied by apply_fva_patch.
+
+    :param raster_list: The FVA00, FVA01, FVA02 and FVA03 raster paths
+    :param raster_02pct_path: The 0.2% raster path
+    :param process_02pct: True if the 0.2% raster should be fixed
+    :param temp_dir: The location where the violation tile index will be saved
+    :param patch_path: The patch file path, without extension - saved as .npz (cells) and .json (summary)
+    :param median_window: Width and height of the median neighborhood in cells
+
+    :return: True if differences remain after fixing, False if all rasters pass
+
+    :process:
+    1.  Build the tile index of blocks with violations - clean blocks are not read again. If a previous run was interrupted, reuse its tile index
+        and rescan the blocks outside it, adding any that now have violations
+    2.  Read the same violating block from every raster, with a halo for the median neighborhood
+    3.  If the block was finished by the previous run and its content hash matches, reuse its cells
+    4.  Otherwise fill extent gaps and enforce the FVA ladder and 0.2% rule on the block (fix_block), and add it to the journal
+    5.  Save the patch file and delete the journal
+    """
+
+    title_text("Finding cell value fixes by block")
+
+    raster_paths = dict(zip(FVA_LADDER, raster_list))
+    if process_02pct:
+        raster_paths["0_2PCT"] = raster_02pct_path
+
+    grid = create_block_grid(list(raster_paths.values()))
+    blocks = create_blocks(grid, block_size)
+    msg(f"Processing {grid['nrows']} x {grid['ncols']} cell grid in {len(blocks)} blocks")
+
+    #A journal of finished tiles lets an interrupted run pick up where it stopped
+    journal_folder = patch_path + "_journal"
+    settings = {"rasters": raster_paths, "grid": [grid["xmin"], grid["ymax"], grid["nrows"], grid["ncols"], grid["cell_size"]],
+                "block_size": block_size, "median_window": median_window, "process_02pct": process_02pct}
+    journal = load_fix_journal(journal_folder, settings)
+    if journal == None:
+        #Fixes are limited to blocks with violations - runtime follows the amount of bad data, not county size
+        tile_index = build_violation_tile_index(raster_paths, grid, blocks, process_02pct, pth.join(temp_dir, "violation_tiles.json"))
+        journal = start_fix_journal(journal_folder, settings, tile_index)
+    else:
+        tile_index = journal["tile_index"]
+        msg(f"Resuming previous run - {len(journal['tiles'])} of {len(tile_index)} tiles already finished")
+
+        #Content hashes only cover the indexed tiles - rescan the other blocks in case the rasters were edited there since the previous run
+        indexed = {tile["id"] for tile in tile_index}
+        new_tiles = build_violation_tile_index(raster_paths, grid, [block for block in blocks if block["id"] not in indexed], process_02pct,
+                                               pth.join(temp_dir, "violation_tiles_resume.json"))
+        if len(new_tiles) > 0:
+            warn(f"{len(new_tiles)} blocks outside the previous tile index now have violations - adding them to the run")
+            tile_index = tile_index + new_tiles
+
+    patch = {FVA: {field: [] for field, dtype in PATCH_FIELDS} for FVA in raster_paths}
+    totals, remaining = {}, {}
+    halo = median_window // 2
+    for block in tile_index:
+        data = {}
+        for FVA, raster_path in raster_paths.items():
+            data[FVA], (row_off, col_off) = read_block(raster_path, grid, block, halo)
+
+        #Finished tiles are reused only if the rasters under them (halo included) have not changed
+        block_hash = hash_block(data)
+        finished = journal["tiles"].get(block["id"])
+        if finished != None and finished["hash"] == block_hash:
+            with np.load(pth.join(journal_folder, f"{block['id']}.npz")) as arrays:
+                cells = {FVA: {field: arrays[f"{FVA}_{field}"] for field, dtype in PATCH_FIELDS} for FVA in raster_paths}
+            counts, block_remaining = finished["counts"], {(lower_FVA, higher_FVA): count for lower_FVA, higher_FVA, count in finished["remaining"]}
+        else:
+            if finished != None:
+                warn(f"Block {block['id']} has changed since it was finished - fixing it again")
+            cells, counts, block_remaining = fix_block(data, block, row_off, col_off, process_02pct, median_window)
+            finish_journal_tile(journal_folder, block, block_hash, cells, counts, block_remaining)
+
+        for FVA in raster_paths:
+            for field, dtype in PATCH_FIELDS:
+                patch[FVA][field].append(cells[FVA][field])
+        for rule, count in counts.items():
+            totals[rule] = totals.get(rule, 0) + count
+        for pair, count in block_remaining.items():
+            remaining[pair] = remaining.get(pair, 0) + count
+
+    for rule, count in totals.items():
+        msg(f"{rule}: {count} cells fixed")
+
+    save_fva_patch(patch_path, patch, grid, raster_paths, totals)
+    shutil.rmtree(journal_folder, ignore_errors=True) #Run finished - the patch file replaces the journal
+
+    failed = False
+    for (lower_FVA, higher_FVA), count in remaining.items():
+        if count > 0:
+            warn(f"{count} cells will still have {higher_FVA} below {lower_FVA} - Raster will not be completely fixed")
+            failed = True
+        else:
+            msg(f"No difference values less than 0 will remain between {lower_FVA} and {higher_FVA}")
+
+    title_text("Finished finding cell value fixes")
+
+    return failed
+
+def fix_block(data, block, row_off, col_off, process_02pct, median_window=MEDIAN_WINDOW):
+    """
+    The fix_block function fixes one block and returns its changed cells.
+
+    :param data: Dictionary of block arrays with their halo - keys are FVA values, NoData is nan
+    :param block: The block
+    :param row_off: Row of the block inside the arrays
+    :param col_off: Column of the block inside the arrays
+
+    :return: Dictionary of changed cells (row, column, old value, new value and rule arrays) for each FVA, dictionary of
+             cell counts per rule, and dictionary of cells still breaking the ladder per FVA pair
+    """
+
+    #Only the block itself is patched - the halo belongs to the neighboring blocks
+    inner = (slice(row_off, row_off + block["nrows"]), slice(col_off, col_off + block["ncols"]))
+    fixed, counts, rules = enforce_fva_ladder(data, process_02pct, inner, median_window)
+
+    cells = {}
+    for FVA in data:
+        before, after = data[FVA][inner], fixed[FVA][inner]
+        changed = ~np.isnan(after) & ((before != after) | np.isnan(before))
+        rows, cols = np.nonzero(changed)
+        cells[FVA] = {"rows": (rows + block["row_off"]).astype(np.int32), "cols": (cols + block["col_off"]).astype(np.int32),
+                      "old": before[changed], "new": after[changed], "rule": rules[FVA][inner][changed]}
+
+    return cells, counts, count_ladder_violations({FVA: values[inner] for FVA, values in fixed.items()}, process_02pct)
+
+def hash_block(data):
+    #Content hash of one block of every raster - used to check finished tiles have not changed
+    digest = hashlib.sha1()
+    for FVA in sorted(data):
+        digest.update(FVA.encode())
+        digest.update(np.ascontiguousarray(data[FVA]).tobytes())
+    return digest.hexdigest()
+
+def start_fix_journal(journal_folder, settings, tile_index):
+    #New journal - the first line holds the settings and tile index, then one line is added per finished tile
+    shutil.rmtree(journal_folder, ignore_errors=True)
+    os.makedirs(journal_folder)
+    with open(pth.join(journal_folder, "journal.jsonl"), "w") as journal_file:
+        journal_file.write(json.dumps({"settings": settings, "tile_index": tile_index}) + "\n")
+    return {"settings": settings, "tile_index": tile_index, "tiles": {}}
+
+def load_fix_journal(journal_folder, settings):
+    """
+    The load_fix_journal function reads the journal left by an interrupted run.
+
+    :return: The journal (settings, tile index and finished tiles), or None if there is no journal or it was made with
+             different rasters or settings
+    """
+
+    journal_path = pth.join(journal_folder, "journal.jsonl")
+    if not os.path.exists(journal_path):
+        return None
+
+    with open(journal_path, "r") as journal_file:
+        lines = journal_file.read().splitlines()
+    try:
+        journal = json.loads(lines[0])
+    except (IndexError, ValueError):
+        warn("Could not read journal from previous run - starting over")
+        return None
+    if journal["settings"] != settings:
+        msg("Rasters or settings have changed since the previous run - starting over")
+        return None
+
+    journal["tiles"] = {}
+    for line in lines[1:]:
+        try:
+            tile = json.loads(line)
+        except ValueError:
+            break #Last line was cut off when the run stopped
+        if os.path.exists(pth.join(journal_folder, f"{tile['id']}.npz")):
+            journal["tiles"][tile["id"]] = tile
+    return journal
+
+def finish_journal_tile(journal_folder, block, block_hash, cells, counts, block_remaining):
+    #Cells are saved before the journal line, so a tile in the journal always has its cells on disk
+    arrays = {f"{FVA}_{field}": values for FVA, FVA_cells in cells.items() for field, values in FVA_cells.items()}
+    np.savez(pth.join(journal_folder, f"{block['id']}.npz"), **arrays)
+
+    tile = {"id": block["id"], "hash": block_hash, "counts": counts,
+            "remaining": [[lower_FVA, higher_FVA, count] for (lower_FVA, higher_FVA), count in block_remaining.items()]}
+    with open(pth.join(journal_folder, "journal.jsonl"), "a") as journal_file:
+        journal_file.write(json.dumps(tile) + "\n")
+        journal_file.flush()
+        os.fsync(journal_file.fileno())
+
+def save_fva_patch(patch_path, patch, grid, raster_paths, rule_counts):
+    """
+    The save_fva_patch function saves a patch as a compressed .npz of the changed cells and a .json summary for review.
+
+    :param patch_path: The patch file path, without extension
+    :param patch: Dictionary of changed cells - keys are FVA values, values are lists of row, col, old, new and rule arrays
+    :param grid: The block engine grid - rows and columns in the patch are on this grid
+    :param raster_paths: Dictionary of raster paths - keys are FVA values
+    :param rule_counts: Dictionary of cell counts per rule
+    """
+
+    arrays = {}
+    for FVA, cells in patch.items():
+        for field, dtype in PATCH_FIELDS:
+            arrays[f"{FVA}_{field}"] = np.concatenate(cells[field]).astype(dtype) if len(cells[field]) > 0 else np.zeros(0, dtype=dtype)
+    np.savez_compressed(patch_path + ".npz", **arrays)
+
+    header = {"rasters": raster_paths,
+              "grid": {"xmin": grid["xmin"], "ymax": grid["ymax"], "cell_size": grid["cell_size"], "nrows": grid["nrows"], "ncols": grid["ncols"],
+                       "spatial_reference": grid["spatial_reference"].exportToString()},
+              "rule_bits": RULE_BITS, "rule_counts": rule_counts,
+              "cells": {FVA: int(len(arrays[f"{FVA}_rows"])) for FVA in patch},
+              "rule_cells": {FVA: count_rule_cells(arrays[f"{FVA}_rule"]) for FVA in patch}}
+    with open(patch_path + ".json", "w") as header_file:
+        json.dump(header, header_file, indent=1)
+
+    msg(f"Patch saved to {patch_path}.npz ({os.path.getsize(patch_path + '.npz') / 1024:.1f} KB)")
+    for FVA, count in header["cells"].items():
+        msg(f"{FVA}: {count} cells to change")
+        for rule, rule_count in header["rule_cells"][FVA].items():
+            if rule_count > 0:
+                msg(f"    {rule}: {rule_count} cells")
+
+def count_rule_cells(rule_bits):
+    #Number of cells changed by each rule - a cell changed by more than one rule is counted under each
+    return {rule: int(np.count_nonzero(rule_bits & bit)) for rule, bit in RULE_BITS.items()}
+
+def get_provenance_raster_path(raster_path):
+    #Provenance rasters are kept out of the FFRMS geodatabase so they are not picked up as FVA rasters or exported
+    FFRMS_Geodatabase = pth.dirname(raster_path)
+    provenance_folder = pth.join(pth.dirname(FFRMS_Geodatabase), "{0}_Fix_Provenance".format(pth.splitext(pth.basename(FFRMS_Geodatabase))[0]))
+    if not os.path.exists(provenance_folder):
+        os.makedirs(provenance_folder)
+    return pth.join(provenance_folder, "{0}_provenance.tif".format(pth.basename(raster_path)))
+
+def mosaic_provenance_tiles(tile_paths, provenance_raster_path, spatial_reference):
+    #uint8 raster covering the changed cells - each value is the sum of the RULE_BITS that changed the cell, NoData where nothing changed
+    msg(f"Saving provenance raster {pth.basename(provenance_raster_path)}")
+    if arcpy.Exists(provenance_raster_path):
+        mgmt.Delete(provenance_raster_path)
+    mgmt.MosaicToNewRaster(input_rasters=";".join(tile_paths), output_location=pth.dirname(provenance_raster_path),
+                           raster_dataset_name_with_extension=pth.basename(provenance_raster_path), coordinate_system_for_the_raster=spatial_reference,
+                           pixel_type="8_BIT_UNSIGNED", number_of_bands=1, mosaic_method="LAST")
+
+def save_provenance_raster(FVA, cells, grid, raster_path, patch_folder):
+    #Writes the rule bits of one raster's patch cells as provenance tiles and mosaics them into its provenance raster
+    provenance_tile_paths = []
+    for block, index in group_patch_cells(cells):
+        provenance = np.zeros((block["nrows"], block["ncols"]), dtype=np.uint8)
+        provenance[cells["rows"][index] - block["row_off"], cells["cols"][index] - block["col_off"]] = cells["rule"][index]
+        provenance_tile_paths.append(write_patch_tile(provenance, provenance > 0, grid, block, pth.join(patch_folder, f"{FVA}_{block['id']}_provenance.tif"),
+                                                      nodata_value=0, dtype=np.uint8))
+    mosaic_provenance_tiles(provenance_tile_paths, get_provenance_raster_path(raster_path), grid["spatial_reference"])
+
+def load_fva_patch(patch_path):
+    #Returns the patch summary, the grid (with a SpatialReference object) and the changed cells of each FVA
+    patch_path = os.path.splitext(patch_path)[0]
+    with open(patch_path + ".json", "r") as header_file:
+        header = json.load(header_file)
+    grid = dict(header["grid"])
+    grid["spatial_reference"] = arcpy.SpatialReference()
+    grid["spatial_reference"].loadFromString(header["grid"]["spatial_reference"])
+    with np.load(patch_path + ".npz") as arrays:
+        patch = {FVA: {field: arrays[f"{FVA}_{field}"] for field, dtype in PATCH_FIELDS} for FVA in header["rasters"]}
+    return header, grid, patch
+
+def group_patch_cells(cells, block_size=BLOCK_SIZE):
+    #Splits the changed cells of one raster by block - yields the block (bounding box of its cells) and the index of its cells
+    keys = (cells["rows"] // block_size).astype(np.int64) * (1 << 32) + cells["cols"] // block_size
+    for key in np.unique(keys):
+        index = np.flatnonzero(keys == key)
+        rows, cols = cells["rows"][index], cells["cols"][index]
+        yield {"id": f"r{rows.min() // block_size}_c{cols.min() // block_size}", "row_off": int(rows.min()), "col_off": int(cols.min()),
+               "nrows": int(rows.max() - rows.min() + 1), "ncols": int(cols.max() - cols.min() + 1)}, index
+
+def apply_fva_patch(patch_path, temp_gdb, temp_dir):
+    """
+    The apply_fva_patch function applies a patch file to the FVA rasters as one all-or-nothing step.
+
+    :param patch_path: The patch file created by fix_fva_rasters_by_block (.npz, .json or no extension)
+    :param temp_gdb: The location where raster backups will be saved
+    :param temp_dir: The location where patch tiles will be saved
+
+    :process:
+    1.  Check that every raster still has the old values recorded in the patch - stop before any changes if not
+    2.  Back up every raster that will change
+    3.  Write each raster's cells as patch tiles and mosaic them into the raster once
+    4.  In the same pass, write the rule bits of each changed cell to a uint8 provenance raster for each FVA
+    5.  If anything fails, restore every raster whose mosaic started from its backup. Backups are deleted when all rasters are updated
+    """
+
+    title_text("Applying FVA Patch")
+
+    header, grid, patch = load_fva_patch(patch_path)
+    to_change = [FVA for FVA in header["rasters"] if len(patch[FVA]["rows"]) > 0]
+    if len(to_change) == 0:
+        msg("Patch has no cells to change")
+        return
+
+    patch_folder = pth.join(temp_dir, "patch_tiles")
+    if not os.path.exists(patch_folder):
+        os.makedirs(patch_folder)
+
+    #Stale check - the patch is only valid for the raster values it was built from. Rasters that already hold the new
+    #values were applied by an earlier run that stopped part way, and are skipped
+    pending = []
+    for FVA in to_change:
+        cells = patch[FVA]
+        has_old, has_new = True, True
+        for block, index in group_patch_cells(cells):
+            values, _ = read_block(header["rasters"][FVA], grid, block)
+            current = values[cells["rows"][index] - block["row_off"], cells["cols"][index] - block["col_off"]]
+            has_old = has_old and np.array_equal(current, cells["old"][index], equal_nan=True)
+            has_new = has_new and np.array_equal(current, cells["new"][index], equal_nan=True)
+        if has_old:
+            pending.append(FVA)
+        elif has_new:
+            msg(f"{pth.basename(header['rasters'][FVA])} already has the patch applied - skipping")
+            #The earlier run may have stopped between the raster and its provenance raster
+            if not arcpy.Exists(get_provenance_raster_path(header["rasters"][FVA])):
+                save_provenance_raster(FVA, cells, grid, header["rasters"][FVA], patch_folder)
+        else:
+            arcpy.AddError(f"{pth.basename(header['rasters'][FVA])} has changed since the patch was created - no rasters were changed. Please create a new patch")
+            exit()
+    msg("Patch matches current raster values")
+    to_change = pending
+
+    backups, started = {}, []
+    try:
+        for FVA in to_change:
+            backup = pth.join(temp_gdb, f"backup_{FVA}")
+            msg(f"Backing up {pth.basename(header['rasters'][FVA])}")
+            mgmt.Copy(header["rasters"][FVA], backup)
+            backups[FVA] = backup #Recorded only once the copy has finished - a partial backup is never restored
+
+        for FVA in to_change:
+            cells = patch[FVA]
+            tile_paths = []
+            for block, index in group_patch_cells(cells):
+                values = np.full((block["nrows"], block["ncols"]), np.nan, dtype=np.float32)
+                values[cells["rows"][index] - block["row_off"], cells["cols"][index] - block["col_off"]] = cells["new"][index]
+                tile_paths.append(write_patch_tile(values, ~np.isnan(values), grid, block, pth.join(patch_folder, f"{FVA}_{block['id']}.tif")))
+            started.append(FVA) #From here the raster may be part-written and has to be restored if anything fails
+            mosaic_patch_tiles(tile_paths, header["rasters"][FVA])
+            save_provenance_raster(FVA, cells, grid, header["rasters"][FVA], patch_folder)
+            for rule, count in count_rule_cells(cells["rule"]).items():
+                if count > 0:
+                    msg(f"{FVA} {rule}: {count} cells")
+    except Exception as e:
+        arcpy.AddError(f"Applying patch failed: {e}")
+        arcpy.AddError("Restoring rasters from backups")
+        #Only rasters whose mosaic started have changed - the others are left as they are
+        for FVA in started:
+            mgmt.Delete(header["rasters"][FVA])
+            mgmt.Copy(backups[FVA], header["rasters"][FVA])
+            if arcpy.Exists(get_provenance_raster_path(header["rasters"][FVA])):
+                mgmt.Delete(get_provenance_raster_path(header["rasters"][FVA]))
+        exit()
+
+    for backup in backups.values():
+        mgmt.Delete(backup)
+    msg(f"Patch applied to {len(to_change)} rasters")
+
 if __name__ == "__main__":
     
     # Set up temp workspace
@@ -844,6 +1666,39 @@ if __name__ == "__main__":
 
     #Get tool input parameters
     FFRMS_Geodatabase = arcpy.GetParameterAsText(0)
+    Fix_Engine = get_optional_parameter(1, "Legacy") #"Legacy" fixes one FVA pair at a time, "Block" fixes every FVA in one sweep
+    Median_Window = get_optional_parameter(2, str(MEDIAN_WINDOW)) #Median neighborhood width/height in cells
+    Median_Repair = get_optional_parameter(3, "Sparse") #Legacy engine only - "Sparse" or "Focal" (FocalStatistics over the raster)
+    Fix_Mode = get_optional_parameter(4, "Fix") #Block engine only - "Fix" (create and apply patch), "Dry_Run" (create patch only) or "Apply_Patch"
+    Patch_File = get_optional_parameter(5, "") #Patch to apply in "Apply_Patch" mode
+
+    if Fix_Engine not in ["Legacy", "Block"]:
+        arcpy.AddError(f"Fix Engine must be Legacy or Block, not {Fix_Engine}")
+        exit()
+    if not Median_Window.isdigit() or int(Median_Window) < 1:
+        arcpy.AddError(f"Median Window must be a whole number of cells greater than 0, not {Median_Window}")
+        exit()
+    Median_Window = int(Median_Window)
+    if Median_Repair not in ["Sparse", "Focal"]:
+        arcpy.AddError(f"Median Repair must be Sparse or Focal, not {Median_Repair}")
+        exit()
+    if Fix_Mode not in ["Fix", "Dry_Run", "Apply_Patch"]:
+        arcpy.AddError(f"Fix Mode must be Fix, Dry_Run or Apply_Patch, not {Fix_Mode}")
+        exit()
+    if Patch_File != "" and not os.path.exists(os.path.splitext(Patch_File)[0] + ".json"):
+        arcpy.AddError(f"Could not find patch file {Patch_File} - the .npz and .json files must be kept together")
+        exit()
+
+    #The Legacy engine edits rasters in place and makes no patch - a dry run would change the rasters
+    if Fix_Engine == "Legacy" and Fix_Mode == "Dry_Run":
+        arcpy.AddError("Dry_Run is only available with the Block engine - the Legacy engine changes the rasters in place. No rasters were changed")
+        exit()
+    if Fix_Engine == "Legacy" and Fix_Mode == "Apply_Patch":
+        warn("Apply_Patch applies the patch file as is - the Legacy engine setting is ignored")
+
+    #Load FVA constraints - the fix and QC tools share one file, so stop before changing anything if it is missing or invalid
+    FIX_CONSTRAINTS = compile_fva_constraints(FVA_CONSTRAINTS_PATH)
+    FREEBOARD_STEPS = FIX_CONSTRAINTS["fix_step"] #Feet added to FVA00 when a violating cell is fixed
 
     #Set Environment
     check_out_spatial_analyst()
@@ -854,14 +1709,31 @@ if __name__ == "__main__":
     #Find Rasters in Geodatabase and create dictionary - Keys are FVA values, Values are Raster path
     raster_list, raster_dict, process_02pct, raster_02pct_path = Find_FVA_Rasters(FFRMS_Geodatabase)
  
-    ## PART 1: FIXING RASTER EXTENTS
-    check_and_fix_raster_extent_differences(temp_gdb, raster_list)
-    
-    ## PART 2: FIXING CELL VALUES
-    failed = calc_fva_diff2(raster_list, temp_gdb)
+    #Patch files are kept next to the FFRMS geodatabase - the temp folder is deleted when all FVAs pass
+    patch_path = pth.join(pth.dirname(FFRMS_Geodatabase), "{0}_FVA_Patch".format(pth.splitext(pth.basename(FFRMS_Geodatabase))[0]))
+
+    if Fix_Mode == "Apply_Patch":
+        apply_fva_patch(Patch_File or patch_path, temp_gdb, temp_dir)
+        failed, failed2 = False, False
+    elif Fix_Engine == "Legacy":
+        ## PART 1: FIXING RASTER EXTENTS
+        check_and_fix_raster_extent_differences(temp_gdb, raster_list)
 
-    # PART 3: FIXING 0.2% RASTER
-    failed2 = Fix_02_pct_Raster(raster_02pct_path, raster_list, temp_gdb, process_02pct)
+        ## PART 2: FIXING CELL VALUES
+        failed = calc_fva_diff2(raster_list, temp_gdb, temp_dir, Median_Window, Median_Repair)
+
+        # PART 3: FIXING 0.2% RASTER
+        failed2 = Fix_02_pct_Raster(raster_02pct_path, raster_list, temp_gdb, process_02pct)
+    else:
+        ## PARTS 1-3: FIXING RASTER EXTENTS, CELL VALUES AND 0.2% RASTER IN ONE SWEEP
+        failed = fix_fva_rasters_by_block(raster_list, raster_02pct_path, process_02pct, temp_dir, patch_path, median_window=Median_Window)
+        failed2 = False
+
+        #Dry run - review the patch file, then run again in "Apply_Patch" mode
+        if Fix_Mode == "Dry_Run":
+            msg("Dry run - no rasters were changed. Review {0}.json and run the tool in Apply_Patch mode to apply it".format(patch_path))
+        else:
+            apply_fva_patch(patch_path, temp_gdb, temp_dir)
 
     #Delete temporary files
     if not failed and not failed2:
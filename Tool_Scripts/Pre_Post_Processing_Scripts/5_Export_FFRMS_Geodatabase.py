@@ -9,6 +9,9 @@ Script documentation
 import arcpy
 import sys
 import os
+import json
+import shutil
+from Raster_Signature import Raster_Signature
 from arcpy import AddMessage as msg
 from arcpy import AddWarning as wrn
 
@@ -54,18 +57,41 @@ def getDirectories(FFRMS_Geodatabase, state_abrv, FIPS_code, riv_or_cst):
 
     return raster_dir, shapefile_dir, shapefile_subdir
 
+def copyCurrentCOG(gdb_raster, cog_dir, output_raster_tif):
+    #Combine FVA Rasters can write a COG of each raster - copy it if the geodatabase raster has not been edited since
+    cog_path = os.path.join(cog_dir, os.path.basename(gdb_raster) + ".tif")
+    signature_path = cog_path + ".json"
+    if not os.path.exists(cog_path) or not os.path.exists(signature_path):
+        return False
+
+    with open(signature_path, "r") as signature_file:
+        signature = json.load(signature_file)["signature"]
+    if signature != Raster_Signature(gdb_raster):
+        msg("{0} has changed since its COG was written - exporting from geodatabase".format(os.path.basename(gdb_raster)))
+        return False
+
+    shutil.copyfile(cog_path, output_raster_tif)
+    return True
+
 def exportRasters(FFRMS_Geodatabase, raster_dir):
     arcpy.AddMessage(u"\u200B")
     arcpy.AddMessage("##### Exporting Rasters to Standalone Geotiff Files #####") 
     arcpy.AddMessage("Saving Rasters to {0}".format(raster_dir))
 
     arcpy.env.workspace = FFRMS_Geodatabase
+    cog_dir = os.path.join(os.path.dirname(FFRMS_Geodatabase), "COG")
 
     for gdb_raster in arcpy.ListRasters():
-        arcpy.AddMessage("Exporting {0}".format(gdb_raster))
         raster_name = os.path.basename(gdb_raster)
         output_raster_tif = os.path.join(raster_dir, raster_name+".tif")
-        arcpy.management.CopyRaster(gdb_raster, output_raster_tif)
+        if copyCurrentCOG(gdb_raster, cog_dir, output_raster_tif):
+            arcpy.AddMessage("Copied existing COG for {0}".format(gdb_raster))
+            continue
+
+        #Export as tiled, compressed Cloud Optimized GeoTIFF - overviews are built once, here, using all cores
+        arcpy.AddMessage("Exporting {0}".format(gdb_raster))
+        with arcpy.EnvManager(pyramid="PYRAMIDS -1 NEAREST DEFAULT 75 NO_SKIP", parallelProcessingFactor="100%", compression="LZW", tileSize="512 512"):
+            arcpy.management.CopyRaster(gdb_raster, output_raster_tif, format="COG")
 
     arcpy.AddMessage("Raster Export Complete")
 
@@ -0,0 +1,28 @@
+"""
+Cell QC constraints shared by the raster QC tools (FFRMS_RasterQC and Run_County_QC_Tool). The ranges come from the
+"qc_cells" pairs in FVA_Constraints.json - keep the QC tools on these functions so they always check the same rule.
+"""
+import arcpy
+from arcpy.sa import RemapRange
+import os
+import sys
+import json
+
+def loadQCConstraints(constraintsFile):
+    """read the cell QC constraints from FVA_Constraints.json - the fix tool reads the same file"""
+    if not os.path.exists(constraintsFile):
+        arcpy.AddError("Could not find FVA constraints file " + constraintsFile)
+        sys.exit()
+    with open(constraintsFile) as f:
+        return {(c["lower"], c["higher"]): c for c in json.load(f)["qc_cells"]}
+
+def qcRemapRange(qcConstraints, lower, higher):
+    """build the pass (0) / fail (1) reclassify ranges for higher minus lower - a null limit passes up to that end of range"""
+    c = qcConstraints[(lower, higher)]
+    low = c["range"][0] if c["min_step"] is None else c["min_step"] - c["tolerance"]
+    high = c["range"][1] if c["max_step"] is None else c["max_step"] + c["tolerance"]
+    remap = [[c["range"][0], low, 1]] if low > c["range"][0] else []
+    remap.append([low, high, 0])
+    if high < c["range"][1]:
+        remap.append([high, c["range"][1], 1])
+    return RemapRange(remap)
@@ -0,0 +1,22 @@
+"""
+Raster signature shared by Combine FVA Rasters (written next to each COG) and Export FFRMS Geodatabase (checked before
+a COG is reused). Keep both tools on this one function so the signatures always compare.
+"""
+import arcpy
+import numpy as np
+import hashlib
+
+SIGNATURE_ROWS = 512 #Rows read at a time - memory use depends on raster width, not raster size
+
+def Raster_Signature(input_raster):
+    #Dimensions, extent and a hash of the cell values - read only, so the raster is never changed by taking its signature
+    raster = arcpy.Raster(input_raster)
+    extent, cell_height = raster.extent, raster.meanCellHeight
+    hasher = hashlib.sha1()
+    for row_off in range(0, raster.height, SIGNATURE_ROWS):
+        nrows = min(SIGNATURE_ROWS, raster.height - row_off)
+        lower_left = arcpy.Point(extent.XMin, extent.YMax - (row_off + nrows) * cell_height)
+        hasher.update(np.ascontiguousarray(arcpy.RasterToNumPyArray(input_raster, lower_left, raster.width, nrows)).tobytes())
+    return {"width": raster.width, "height": raster.height,
+            "extent": [extent.XMin, extent.YMin, extent.XMax, extent.YMax],
+            "sha1": hasher.hexdigest()}